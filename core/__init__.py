@@ -2,12 +2,75 @@
 SAMPLE_FREQ = 48000  # sample frequency in Hz
 WINDOW_SIZE = 48000  # window size of the DFT in samples
 WINDOW_STEP = 12000  # step size of window
+BLOCK_SIZE = 1024  # samples per audio callback of the live tuner, hops are collected from these blocks
+ADAPTIVE_WINDOW = True  # size window and hop from the lowest string of the selected tuning
+WINDOW_PERIODS = 16  # periods of the lowest searched frequency in an adaptive window
+MIN_WINDOW_SIZE = 2048  # shortest adaptive window in samples
+HOPS_PER_WINDOW = 4  # adaptive hop = window / HOPS_PER_WINDOW
+DUAL_WINDOW = False  # also analyse a quarter length window, it takes over once it is steady on another note
+DUAL_AGREE_CENTS = 15  # readings closer than this agree - the more precise long one is kept when both agree
+DUAL_STEADY_HOPS = 2  # consecutive agreeing short window readings before they overrule the long window
+CHANNELS = 1  # input channels tuned at the same time, e.g. one instrument per interface input
+MAX_QUEUED_HOPS = 4  # hops buffered for the analysis worker before the oldest block is dropped
 NUM_HPS = 5  # max number of harmonic product spectrums
+PHASE_VOCODER = True  # refine spectral readings from the phase advance of the peak bin between consecutive hops
+PHASE_VOCODER_MAX_WINDOW = 16384  # longest window refined - longer ones resolve the peak better on their own
+PITCH_DETECTOR = 'hps'  # session default pitch detector: hps, autocorr, yin or mpm
+INSTRUMENT_DETECTORS = {'bass': 'yin'}  # per instrument overrides in full tuning - short windows for low strings
+ACF_CUTOFF = 0.9  # autocorrelation - first peak reaching ACF_CUTOFF*highest peak is the period
+MPM_CUTOFF = 0.93  # McLeod pitch method - first key maximum reaching MPM_CUTOFF*highest one is the period
+YIN_THRESH = 0.15  # yin - first dip of the normalised difference under YIN_THRESH is the period
+STRING_TRACKING = True  # full tuning only tracks the current string and its harmonics with a goertzel filter bank
+TARGET_CENTS = 150  # cents searched below and above the target string by the filter bank
+TARGET_CENTS_STEP = 10  # spacing of the filter bank in cents, readings are interpolated between filters
+TARGET_PERIODS = 20  # periods of the target string covered by the filter bank window
+TARGET_ENERGY = 0.3  # share of the window energy the target's harmonics must hold, otherwise another string rings
+TARGET_FUNDAMENTAL = 0.05  # share the fundamental alone must hold - a string an octave up only feeds the harmonics
+TARGET_SUBHARMONIC = 0.5  # max magnitude at half the target relative to the fundamental, more is an octave down
+MIN_FREQ = 25  # lowest fundamental searched by the chromatic tuner in Hz
+MAX_FREQ = 2000  # highest fundamental searched by the chromatic tuner in Hz
+TUNING_MARGIN = 4  # semitones searched below the lowest and above the highest string of a tuning
+TRACKER_HISTORY = 8  # accepted readings per channel kept by the pitch tracker
+TRACKER_OUTLIER_CENTS = 35  # readings this far from the median of the kept ones are outliers, or a new note
+TRACKER_ONSET_HOPS = 2  # consecutive agreeing outliers that start a new note
+TRACKER_HOLD_HOPS = 3  # hops without a reading before the tracked note is dropped
+TRACKER_SETTLE_HOPS = 3  # readings after an onset until the tracker is fully confident
+TRACKER_NOISE_CENTS = 2  # least measurement noise of a reading assumed by the kalman filter
+TRACKER_DRIFT_CENTS = 1  # drift of the played pitch per hop allowed by the kalman filter, e.g. a turning peg
+TRACKER_STABLE = 0.5  # confidence from which a reading counts as stable
+IDENTIFY_STABLE_HOPS = 3  # hops a reading has to hold before tuning identification collects it as a string
+IDENTIFY_STABLE_CENTS = 10  # max spread of those readings, closer pitches are merged into one string
+IDENTIFY_MISS_CENTS = 100  # distances between played pitches and strings are capped at this when scoring tunings
 POWER_THRESH = 1e-5  # tuning is activated if the signal power exceeds this threshold
 CONCERT_PITCH = 440  # base frequency of the a4 note - 440Hz
+TEMPERAMENT = 'equal'  # note table temperament: equal, just, pythagorean or werckmeister3
 WHITE_NOISE_THRESH = 0.2  # everything under WHITE_NOISE_THRESH*avg_energy_per_freq is cut off
 WINDOW_T_LEN = WINDOW_SIZE / SAMPLE_FREQ  # length of the window in seconds
 SAMPLE_T_LENGTH = 1 / SAMPLE_FREQ  # length between two samples in seconds
 DELTA_FREQ = SAMPLE_FREQ / WINDOW_SIZE  # frequency step width of the interpolated DFT
 OCTAVE_BANDS = [50, 100, 200, 400, 800, 1600, 3200, 6400, 12800, 25600]  # octave bands for the frequency calculation
+BASS_BANDS = [25, 35, 50, 70, 100, 140, 200, 400, 800, 1600, 3200, 6400, 12800, 25600]  # finer low bands for bass
+METRICS_FILE = None  # json file for periodic engine metrics snapshots, e.g. "metrics.json" - None disables them
+METRICS_INTERVAL = 10  # seconds between metrics snapshots written to the metrics file
+PROFILE_SLOWEST_HOPS = 0  # keep the stage breakdown of the N slowest hops, 0 disables the profiler
+SERVER_HOST = '127.0.0.1'  # interface of the headless tuning server (python -m core.server)
+SERVER_PORT = 8765  # port of the headless tuning server
+SERVER_MAX_CHUNK_SECONDS = 4  # longest audio frame a client may send, larger ones are refused before they are read
+SERVER_MAX_HELLO = 2 ** 16  # longest hello frame in bytes
+LATENCY_HISTORY = 1024  # chunks per session kept for the latency percentiles of the server
+RECORD_DIR = None  # record the input and readings of every stream to a session directory in here, e.g. "sessions"
+RECORD_CHUNK_SECONDS = 60  # seconds of audio per chunk file of a recorded session
+STARTUP_REPORT = False  # print how long the app took to start, also enabled by `python main.py --startup-report`
+GUI_FRAME_RATE = 60  # max redraws per second of the tuner window
+PLOT_MAX_FREQ = 700  # the FFT chart is cropped to this frequency in Hz
+WATERFALL = True  # show a scrolling spectrogram of the last hops under the FFT chart
+WATERFALL_FRAMES = 200  # hops shown by the spectrogram
+WATERFALL_BINS = 256  # log spaced frequency rows of the spectrogram
+WATERFALL_MIN_FREQ = 30  # frequency range of the spectrogram in Hz
+WATERFALL_MAX_FREQ = 2000
+WATERFALL_DB_RANGE = 60  # dB below full scale shown by the spectrogram colours
+TONE_CACHE_BYTES = 64 * 2 ** 20  # memory cap of the cache of rendered reference tones
+DRONE_LEVEL = 0.3  # peak level of the streamed reference drone
+DRONE_GLIDE = 0.05  # seconds the drone takes to glide most of the way to a new string
+EXPORT_TONES = False  # also write every played reference tone to assets/<instrument>/ in the background
 ALL_NOTES = ["A", "A#", "B", "C", "C#", "D", "D#", "E", "F", "F#", "G", "G#"]  # there are 12 notes in an octave
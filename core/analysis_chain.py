@@ -0,0 +1,39 @@
+# core/analysis_chain.py
+
+import copy
+
+from core import OCTAVE_BANDS, PHASE_VOCODER_MAX_WINDOW
+from core.spectrum import SpectralFrontEnd
+from core.noise_gate import NoiseGate
+from core.phase_vocoder import PhaseVocoder
+
+
+class SpectralChain:
+    # the spectral stages sized by one analysis window: hann window and FFT buffers, noise gate, phase vocoder
+    # state and the spectral detectors built for its bin width. TunerEngine keeps one chain per window size,
+    # so switching between instruments only swaps references.
+    def __init__(self, window_size, sample_freq, num_hps, white_noise_thresh, bands=OCTAVE_BANDS, channels=1):
+        self.window_size = window_size
+        self.white_noise_thresh = white_noise_thresh
+        self.channels = channels
+        self.front_end = SpectralFrontEnd(window_size, sample_freq, channels)
+        self.noise_gate = NoiseGate(self.front_end.delta_freq, window_size // 2, bands, white_noise_thresh,
+                                    channels=channels)
+        self.phase_vocoder = PhaseVocoder(window_size, sample_freq, num_hps, channels)
+        # the phase advance only beats the interpolated peak of short windows, long ones read worse with it
+        self.refine_phase = window_size <= PHASE_VOCODER_MAX_WINDOW
+        self.detectors = {}  # spectral detectors by name
+
+    def set_noise_bands(self, bands):
+        # finer bands give the noise gate more resolution in the bass register
+        if bands != self.noise_gate.bands:
+            self.noise_gate = NoiseGate(self.front_end.delta_freq, self.window_size // 2, bands,
+                                        self.white_noise_thresh, channels=self.channels)
+
+    def fork(self):
+        # a chain of another engine on the same stages - the window, FFT buffers, noise gate and detectors are
+        # shared, only the phase vocoder keeps per stream state. all forks have to run on one thread.
+        chain = copy.copy(self)
+        chain.phase_vocoder = PhaseVocoder(self.window_size, self.front_end.sample_freq,
+                                           len(self.phase_vocoder.harmonics), self.channels)
+        return chain
@@ -0,0 +1,90 @@
+# core/analysis_worker.py
+
+import threading
+import traceback
+from collections import deque
+
+import numpy as np
+
+# arrival of a queued block: perf_counter at the callback, ADC time of the stream clock (nan without one),
+# overflow (1) and underflow (2) flags of the callback
+STAMP = np.dtype([('received', '<f8'), ('adc_time', '<f8'), ('status', 'u1')])
+
+
+class HopQueue:
+    # bounded queue between the audio callback and the analysis worker.
+    # blocks are copied into preallocated slots, when the worker falls behind the oldest block is dropped and counted.
+    def __init__(self, block_size, max_hops, channels=1, dtype=np.float32):
+        # +2 slots: one being written, one being analysed
+        self.slots = np.zeros((max_hops + 2, block_size, channels), dtype=dtype)
+        self.lengths = np.zeros(max_hops + 2, dtype=np.intp)
+        self.stamps = np.zeros(max_hops + 2, dtype=STAMP)
+        self.next_slot = 0
+        self.current = None  # slot returned by the last get()
+        self.pending = deque(maxlen=max_hops)  # a full deque discards its oldest entry on append
+        self.dropped_blocks = 0
+        self.ready = threading.Event()
+
+    def put(self, samples, received=0.0, adc_time=np.nan, status=0):
+        # samples: (frames, channels) as delivered by the input stream
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % len(self.slots)
+        frames = min(len(samples), self.slots.shape[1])
+        self.slots[slot, :frames] = samples[:frames]
+        self.lengths[slot] = frames
+        self.stamps[slot] = (received, adc_time, status)
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped_blocks += 1
+        self.pending.append(slot)
+        self.ready.set()
+
+    def get(self, timeout=None):
+        while True:
+            try:
+                slot = self.current = self.pending.popleft()
+                return self.slots[slot, :self.lengths[slot]]
+            except IndexError:
+                self.ready.clear()
+                if self.pending:
+                    continue  # a hop arrived between popleft and clear
+                # a wake up without a hop is stop() - return instead of waiting out the timeout again
+                if not self.ready.wait(timeout) or not self.pending:
+                    return None
+
+    def clear(self):
+        self.pending.clear()
+        self.current = None
+        self.dropped_blocks = 0
+
+
+class AnalysisWorker(threading.Thread):
+    # runs the pitch pipeline off the audio thread, the callback only feeds the hop queue.
+    def __init__(self, engine, hop_queue):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.hop_queue = hop_queue
+        self.running = False
+
+    def run(self):
+        self.running = True
+        while self.running:
+            status, self.engine.last_status = self.engine.last_status, None
+            if status:
+                print(status)
+            samples = self.hop_queue.get(timeout=0.1)
+            if samples is None or not self.running:
+                continue
+            try:
+                self.engine.process_hop(samples)
+            except Exception:
+                # the callback would keep queueing hops nobody analyses - stop the stream instead of dying silently
+                traceback.print_exc()
+                print("Analysis failed, stopping the tuner")
+                self.running = False
+                self.engine.stop_stream()
+
+    def stop(self):
+        self.running = False
+        self.hop_queue.ready.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
@@ -0,0 +1,144 @@
+# core/analyze.py
+# headless batch analysis of recorded takes with the live tuner's detection:
+#   python -m core.analyze takes/ --output results.csv --workers 8
+
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import soundfile as sf
+
+from core import WINDOW_T_LEN, WINDOW_STEP, SAMPLE_FREQ, NUM_HPS, POWER_THRESH, WHITE_NOISE_THRESH, PITCH_DETECTOR, \
+    CONCERT_PITCH, TEMPERAMENT
+from core.chromatuna_engine import TunerEngine, DETECTORS
+from core.note_table import TEMPERAMENTS
+
+AUDIO_EXTENSIONS = ('.wav', '.flac')
+FIELDS = ['file', 'channel', 'hop', 'time', 'note', 'freq', 'pitch', 'cents']
+STRING_FIELDS = ['string', 'string_cents']  # added with --tuning
+
+
+def analyze_file(path, window_t_len=WINDOW_T_LEN, step_t_len=WINDOW_STEP / SAMPLE_FREQ, num_hps=NUM_HPS,
+                 detector=PITCH_DETECTOR, reference=CONCERT_PITCH, temperament=TEMPERAMENT, strings=None, target=None):
+    # streams the file in hop sized blocks - only one window of audio is held in memory.
+    # every channel of the file is analysed, all channels in one pass of the engine.
+    # with strings ({name: frequency} of a tuning) every reading is also matched to the nearest string.
+    # with a target (frequency of the string played) targeted detectors like goertzel report against it.
+    info = sf.info(path)
+    sample_freq = info.samplerate
+    window_size = int(round(window_t_len * sample_freq))
+    window_step = int(round(step_t_len * sample_freq))
+    engine = TunerEngine(sample_freq, window_size, window_step, num_hps, POWER_THRESH, WHITE_NOISE_THRESH, None,
+                         info.channels)
+    engine.verbose = False
+    engine.set_detector(detector)
+    engine.set_reference(reference, temperament)
+    engine.set_target(target)
+    if strings:
+        engine.set_strings(strings)
+
+    rows = []
+    for hop, block in enumerate(sf.blocks(path, blocksize=window_step, dtype='float32', always_2d=True)):
+        engine.process_hop(block)
+        if strings:
+            # one vectorized lookup for all channels of the hop, on the reported frequencies - the tracker holds a
+            # note through hops the detector missed, where detected_freqs is nan
+            string_idx, _, string_cents = engine.note_table.nearest_string(engine.tracked_freqs)
+        for channel, result in enumerate(engine.channel_results):
+            if result is None:
+                continue
+            note, freq, pitch, diff = result
+            row = {
+                'file': path,
+                'channel': channel,
+                'hop': hop,
+                'time': round((hop * window_step + len(block)) / sample_freq, 3),
+                'note': note,
+                'freq': freq,
+                'pitch': pitch,
+                'cents': round(float(engine.detected_cents[channel]), 1),
+            }
+            if strings:
+                row['string'] = str(engine.note_table.string_names[string_idx[channel]])
+                row['string_cents'] = round(float(string_cents[channel]), 1)
+            rows.append(row)
+    return rows
+
+
+def collect_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.lower().endswith(AUDIO_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+def write_rows(rows, out, output_format, writer=None):
+    if output_format == 'jsonl':
+        for row in rows:
+            out.write(json.dumps(row) + '\n')
+    else:
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m core.analyze', description="Offline pitch analysis of audio files")
+    parser.add_argument('paths', nargs='+', help="audio files or directories with .wav/.flac takes")
+    parser.add_argument('--output', '-o', help="result file, stdout if omitted")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="output format, guessed from --output by default")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--window', type=float, default=WINDOW_T_LEN, help="analysis window in seconds")
+    parser.add_argument('--step', type=float, default=WINDOW_STEP / SAMPLE_FREQ, help="hop size in seconds")
+    parser.add_argument('--num-hps', type=int, default=NUM_HPS, help="number of harmonic product spectrums")
+    parser.add_argument('--detector', choices=list(DETECTORS), default=PITCH_DETECTOR, help="pitch detector")
+    parser.add_argument('--reference', type=float, default=CONCERT_PITCH, help="a4 reference pitch in Hz")
+    parser.add_argument('--temperament', choices=list(TEMPERAMENTS), default=TEMPERAMENT)
+    parser.add_argument('--target', type=float, help="frequency of the string played in Hz, required by goertzel")
+    parser.add_argument('--tuning', help="match readings to the strings of a tuning, e.g. guitar/standard")
+    parser.add_argument('--tunings', default='assets/tunings.json')
+    args = parser.parse_args(argv)
+    if DETECTORS[args.detector].domain == 'block' and args.target is None:
+        parser.error(f"--detector {args.detector} only tracks a target string, give its frequency with --target")
+
+    strings = None
+    if args.tuning:
+        instrument, tuning = args.tuning.split('/')
+        with open(args.tunings, "r") as file:
+            strings = json.load(file)[instrument][tuning][0]['tuning']
+
+    output_format = args.format
+    if output_format is None:
+        output_format = 'jsonl' if args.output and args.output.endswith(('.jsonl', '.json')) else 'csv'
+    files = collect_files(args.paths)
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    writer = None
+    if output_format == 'csv':
+        writer = csv.DictWriter(out, fieldnames=FIELDS + STRING_FIELDS if strings else FIELDS)
+        writer.writeheader()
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            # files fan out across all cores, results are written in input order as they complete
+            analyze = partial(analyze_file, window_t_len=args.window, step_t_len=args.step, num_hps=args.num_hps,
+                              detector=args.detector, reference=args.reference, temperament=args.temperament,
+                              strings=strings, target=args.target)
+            results = executor.map(analyze, files)
+            for path, rows in zip(files, results):
+                write_rows(rows, out, output_format, writer)
+                # a row per channel with a reading, hops without one are left out
+                print(f"{path}: {len(rows)} readings", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
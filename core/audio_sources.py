@@ -0,0 +1,158 @@
+# core/audio_sources.py
+
+import threading
+from time import perf_counter
+
+import numpy as np
+
+from core import SAMPLE_FREQ, BLOCK_SIZE
+from core.drone import Drone
+
+
+class AudioSource:
+    # where the audio of a TunerEngine comes from. a source calls callback(indata, frames, time_info, status) with
+    # (frames, channels) float32 blocks like a sounddevice input stream until it runs out or is stopped, and calls
+    # finished() once afterwards. realtime sources deliver at the pace of an audio clock, the others run on their
+    # own thread as fast as the callback returns - or `speed` times real time when a speed is given.
+    realtime = False
+
+    def __init__(self, sample_freq=SAMPLE_FREQ, channels=1, block_size=BLOCK_SIZE, speed=None):
+        self.sample_freq = sample_freq
+        self.channels = channels
+        self.block_size = block_size
+        self.speed = speed
+        self.frames = 0  # frames delivered since start
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self, callback, finished=None):
+        self.frames = 0
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, args=(callback, finished), daemon=True)
+        self.thread.start()
+
+    def run(self, callback, finished):
+        start = perf_counter()
+        try:
+            for block in self.blocks():
+                if self.stopping.is_set():
+                    break
+                callback(block, len(block), None, None)
+                self.frames += len(block)
+                if self.speed:
+                    # sleep until the audio delivered so far is due, an event wait so stop() cuts it short
+                    delay = self.frames / (self.sample_freq * self.speed) - (perf_counter() - start)
+                    if delay > 0 and self.stopping.wait(delay):
+                        break
+        finally:
+            if finished:
+                finished()
+
+    def blocks(self):
+        # yields (frames, channels) float32 blocks, buffers may be reused between blocks
+        raise NotImplementedError
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+
+class DeviceSource(AudioSource):
+    # the default input device. with an output callback (the drone) input and output share one duplex stream,
+    # so the tone and the analysed audio run on the same sample clock.
+    realtime = True
+
+    def __init__(self, sample_freq=SAMPLE_FREQ, channels=1, block_size=BLOCK_SIZE, output=None):
+        super().__init__(sample_freq, channels, block_size)
+        self.output = output  # output callback(outdata, frames, time_info, status) of a duplex stream
+        self.stream = None
+
+    def start(self, callback, finished=None):
+        import sounddevice as sd  # only the live tuner needs PortAudio - batch analysis runs headless
+
+        if self.output:
+            output = self.output
+
+            def duplex(indata, outdata, frames, time_info, status):
+                output(outdata, frames, time_info, status)
+                callback(indata, frames, time_info, status)
+
+            try:
+                self.stream = sd.Stream(channels=(self.channels, 1), callback=duplex, blocksize=self.block_size,
+                                        samplerate=self.sample_freq, dtype='float32', finished_callback=finished)
+                self.stream.start()
+                return
+            except Exception as exc:
+                # a missing or busy output device must not take the tuner down - tune with the input alone
+                print(f"Output unavailable, tuning without it: {exc}")
+                self.output = None
+                if self.stream is not None:
+                    self.stream.close()
+                    self.stream = None
+        self.stream = sd.InputStream(channels=self.channels, callback=callback, blocksize=self.block_size,
+                                     samplerate=self.sample_freq, dtype='float32', finished_callback=finished)
+        self.stream.start()
+
+    def stop(self):
+        # abort drops the queued buffers instead of playing them out, the device is released right away
+        if self.stream is not None:
+            self.stream.abort()
+            self.stream.close()
+            self.stream = None
+
+
+class BufferSource(AudioSource):
+    # audio already in memory, (frames,) or (frames, channels)
+    def __init__(self, audio, sample_freq=SAMPLE_FREQ, block_size=BLOCK_SIZE, speed=None):
+        audio = np.asarray(audio, dtype=np.float32)
+        self.audio = np.ascontiguousarray(audio.reshape(len(audio), -1))
+        super().__init__(sample_freq, self.audio.shape[1], block_size, speed)
+
+    def blocks(self):
+        for start in range(0, len(self.audio), self.block_size):
+            yield self.audio[start:start + self.block_size]
+
+
+class FileSource(AudioSource):
+    # a .wav/.flac file streamed block by block into one reused buffer - only a block is held in memory
+    def __init__(self, path, block_size=BLOCK_SIZE, speed=None):
+        import soundfile as sf
+
+        self.path = path
+        info = sf.info(path)
+        super().__init__(info.samplerate, info.channels, block_size, speed)
+        self.buffer = np.zeros((block_size, info.channels), dtype=np.float32)
+
+    def blocks(self):
+        import soundfile as sf
+
+        yield from sf.blocks(self.path, out=self.buffer)
+
+
+class GeneratorSource(AudioSource):
+    # a synthesized string held by a Drone, optionally gliding through `frequencies` one every `seconds`.
+    # without a duration it plays until stopped.
+    def __init__(self, frequencies, instrument='guitar', sample_freq=SAMPLE_FREQ, channels=1, block_size=BLOCK_SIZE,
+                 seconds=2.0, duration=None, speed=None, inharmonicity=0.0):
+        super().__init__(sample_freq, channels, block_size, speed)
+        self.frequencies = np.atleast_1d(frequencies)
+        self.seconds = seconds
+        self.duration = duration
+        self.drone = Drone(instrument, sample_freq, block_size, inharmonicity)
+        self.drone.driven = True  # rendered here, never on an output stream of its own
+        self.buffer = np.zeros((block_size, channels), dtype=np.float32)
+
+    def blocks(self):
+        total = None if self.duration is None else int(self.duration * self.sample_freq)
+        per_frequency = max(1, int(self.seconds * self.sample_freq))
+        self.drone.play(self.frequencies[0])
+        frames = 0
+        while total is None or frames < total:
+            self.drone.set_frequency(self.frequencies[min(frames // per_frequency, len(self.frequencies) - 1)])
+            count = self.block_size if total is None else min(self.block_size, total - frames)
+            self.buffer[:count] = self.drone.render(count)[:, None]
+            frames += count
+            yield self.buffer[:count]
+        self.drone.stop()
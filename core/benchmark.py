@@ -0,0 +1,214 @@
+# core/benchmark.py
+# speed and accuracy benchmark of the detection pipeline on synthesized strings:
+#   python -m core.benchmark --window-sizes 48000,24000 --steps 12000,6000 --num-hps 3,5 --detectors hps,yin
+
+import argparse
+import itertools
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from core import SAMPLE_FREQ, WINDOW_SIZE, WINDOW_STEP, NUM_HPS, POWER_THRESH, WHITE_NOISE_THRESH, PITCH_DETECTOR
+from core.chromatuna_engine import TunerEngine, DETECTORS
+from core.sound_generator import SoundGenerator
+
+MISS_CENTS = 50  # readings further off than this count as misses (wrong note or octave)
+
+
+class FakeCallbackDriver:
+    # plays a buffer through the engine the way the input stream would, but as fast as possible:
+    # each block goes through audio_callback and is analysed right away from the hop queue.
+    def __init__(self, engine, block_size):
+        self.engine = engine
+        self.block_size = block_size
+
+    def blocks(self, audio):
+        audio = audio.reshape(len(audio), -1).astype(np.float32)
+        for start in range(0, len(audio) - self.block_size + 1, self.block_size):
+            yield audio[start:start + self.block_size]
+
+    def push(self, block):
+        self.engine.feed(block, len(block), None, None)
+
+
+def load_strings(path='assets/tunings.json'):
+    with open(path, "r") as file:
+        tunings = json.load(file)
+    for instrument, presets in tunings.items():
+        for tuning, preset in presets.items():
+            frequencies = list(preset[0]['tuning'].values())
+            for string, frequency in preset[0]['tuning'].items():
+                yield instrument, tuning, string, frequency, frequencies
+
+
+def run_config(detector, window_size, window_step, num_hps, args, rng):
+    engine = TunerEngine(SAMPLE_FREQ, window_size, window_step, num_hps, POWER_THRESH, WHITE_NOISE_THRESH, None,
+                         block_size=args.block)
+    engine.verbose = False
+    engine.adapt_window = args.adaptive
+    engine.dual_window = args.dual_window
+    engine.set_detector(detector)
+    if args.no_phase_vocoder:
+        engine.refine_phase = False
+    driver = FakeCallbackDriver(engine, engine.block_size)
+    generator = SoundGenerator()
+    latencies, allocations, errors = [], [], []
+    octave_hops = octave_readings = 0
+    audio_seconds = 0
+
+    for instrument, tuning, string, frequency, frequencies in load_strings(args.tunings):
+        if args.tuning_range:
+            engine.set_tuning_range(frequencies)
+        if args.target:
+            engine.set_target(frequency)
+        detune = rng.uniform(-args.detune, args.detune)
+        played_freq = frequency * 2 ** (detune / 1200)
+        # detuned one-off tones bypass the tone cache
+        audio = generator.render(instrument, played_freq, args.duration, SAMPLE_FREQ, args.inharmonicity)
+        audio *= args.level
+        if args.snr is not None:
+            noise_rms = np.sqrt(np.mean(audio ** 2)) / 10 ** (args.snr / 20)
+            audio += rng.normal(0, noise_rms, len(audio))
+        audio_seconds += len(audio) / SAMPLE_FREQ
+
+        engine.reset_analysis()
+        for hop, block in enumerate(driver.blocks(audio)):
+            if args.allocations:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            driver.push(block)
+            latencies.append(time.perf_counter() - start)
+            if args.allocations:
+                allocations.append(tracemalloc.get_traced_memory()[1] - before)
+            # accuracy is only judged once the detector's window is completely filled with the string
+            filled = (hop + 1) * engine.block_size >= (engine.detector.window_size or engine.analysis_size)
+            if filled and engine.channel_results[0] is not None:
+                freqs = engine.tracked_freqs if args.tracked else engine.detected_freqs
+                errors.append(1200 * np.log2(freqs[0] / played_freq))
+
+        if args.target:
+            # a string an octave up or down shares the target's harmonics - a targeted detector has to stay silent
+            for octave in (2, 0.5):
+                audio = generator.render(instrument, played_freq * octave, args.duration, SAMPLE_FREQ,
+                                         args.inharmonicity) * args.level
+                engine.reset_analysis()
+                for hop, block in enumerate(driver.blocks(audio)):
+                    driver.push(block)
+                    if (hop + 1) * engine.block_size >= (engine.detector.window_size or engine.analysis_size):
+                        octave_hops += 1
+                        octave_readings += engine.channel_results[0] is not None
+
+    latencies = np.array(latencies) * 1000
+    errors = np.abs(errors)
+    hits = errors[errors <= MISS_CENTS]
+    return {
+        'detector': detector,
+        'window_size': window_size,
+        'window_step': window_step,
+        'num_hps': num_hps,
+        'hops': len(latencies),
+        'latency_p50_ms': float(np.percentile(latencies, 50)),
+        'latency_p90_ms': float(np.percentile(latencies, 90)),
+        'latency_p99_ms': float(np.percentile(latencies, 99)),
+        'latency_max_ms': float(latencies.max()),
+        'realtime_factor': audio_seconds / (latencies.sum() / 1000),
+        'alloc_p50_kib': float(np.percentile(allocations, 50)) / 1024 if allocations else None,
+        'error_p50_cents': float(np.percentile(hits, 50)) if len(hits) else None,
+        'error_p95_cents': float(np.percentile(hits, 95)) if len(hits) else None,
+        'miss_rate': 1 - len(hits) / len(errors) if len(errors) else None,
+        'octave_accept_rate': octave_readings / octave_hops if octave_hops else None,
+    }
+
+
+def format_row(result):
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else '-'.rjust(len(format(0.0, spec)))
+    return (f"{result['detector']:>8} {result['window_size']:>7} {result['window_step']:>6} {result['num_hps']:>4} "
+            f"{fmt(result['latency_p50_ms'], '8.2f')} {fmt(result['latency_p90_ms'], '8.2f')} "
+            f"{fmt(result['latency_p99_ms'], '8.2f')} {fmt(result['realtime_factor'], '8.0f')}x "
+            f"{fmt(result['alloc_p50_kib'], '9.1f')} {fmt(result['error_p50_cents'], '8.2f')} "
+            f"{fmt(result['error_p95_cents'], '8.2f')} {fmt(result['miss_rate'], '6.1%')} "
+            f"{fmt(result['octave_accept_rate'], '6.1%')}")
+
+
+def check_regressions(results, baseline_path, tolerance):
+    with open(baseline_path, "r") as file:
+        baseline = {(b.get('detector', PITCH_DETECTOR), b['window_size'], b['window_step'], b['num_hps']): b
+                    for b in json.load(file)}
+    regressions = []
+    for result in results:
+        before = baseline.get((result['detector'], result['window_size'], result['window_step'], result['num_hps']))
+        if before is None:
+            continue
+        for key in ('latency_p50_ms', 'error_p95_cents'):
+            if before[key] and result[key] and result[key] > before[key] * (1 + tolerance):
+                regressions.append(f"{key} {before[key]:.2f} -> {result[key]:.2f} "
+                                   f"({result['detector']} {result['window_size']}/{result['window_step']}/"
+                                   f"{result['num_hps']})")
+    return regressions
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m core.benchmark', description="DSP benchmark and accuracy suite")
+    parser.add_argument('--detectors', type=lambda value: value.split(','), default=[PITCH_DETECTOR],
+                        help=f"comma separated detectors out of {', '.join(DETECTORS)}")
+    parser.add_argument('--window-sizes', type=int_list, default=[WINDOW_SIZE])
+    parser.add_argument('--steps', type=int_list, default=[WINDOW_STEP])
+    parser.add_argument('--num-hps', type=int_list, default=[NUM_HPS])
+    parser.add_argument('--tunings', default='assets/tunings.json')
+    parser.add_argument('--duration', type=float, default=2.5, help="seconds synthesized per string")
+    parser.add_argument('--level', type=float, default=0.3, help="peak level of the synthesized strings")
+    parser.add_argument('--detune', type=float, default=0, help="max random detuning in cents")
+    parser.add_argument('--snr', type=float, help="add white noise at this signal to noise ratio in dB")
+    parser.add_argument('--inharmonicity', type=float, default=0, help="string stiffness coefficient B")
+    parser.add_argument('--tuning-range', action='store_true', help="search only around each tuning's strings")
+    parser.add_argument('--no-phase-vocoder', action='store_true', help="keep the raw spectral detector readings")
+    parser.add_argument('--block', type=int, help="frames per callback block, the step by default")
+    parser.add_argument('--adaptive', action='store_true',
+                        help="size the window from each tuning (with --tuning-range)")
+    parser.add_argument('--dual-window', action='store_true', help="also analyse a quarter length window")
+    parser.add_argument('--target', action='store_true',
+                        help="tell the engine which string is played, like full tuning, and check that strings an "
+                             "octave up or down are rejected")
+    parser.add_argument('--tracked', action='store_true', help="judge the pitch tracker's output, not the detector's")
+    parser.add_argument('--allocations', action='store_true', help="trace memory allocated per hop (slower)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--baseline', help="compare against results written earlier with --json")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown/error growth vs baseline")
+    args = parser.parse_args(argv)
+
+    if args.allocations:
+        tracemalloc.start()
+    print(f"{'detector':>8} {'window':>7} {'step':>6} {'hps':>4} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+          f"{'speed':>9} {'alloc KiB':>9} {'err p50':>8} {'err p95':>8} {'miss':>6} {'octave':>6}")
+    results = []
+    configs = itertools.product(args.detectors, args.window_sizes, args.steps, args.num_hps)
+    for detector, window_size, window_step, num_hps in configs:
+        if window_step > window_size:
+            continue
+        # same seed for every configuration so they all hear the same detuning and noise
+        result = run_config(detector, window_size, window_step, num_hps, args, np.random.default_rng(args.seed))
+        results.append(result)
+        print(format_row(result))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        regressions = check_regressions(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
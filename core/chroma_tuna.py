@@ -1,13 +1,14 @@
 # core/chroma_tuna.py
 
-import threading
 import customtkinter as ctk
-import numpy as np
-import matplotlib.pyplot as plt
 
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from core import OCTAVE_BANDS, BASS_BANDS, BLOCK_SIZE, GUI_FRAME_RATE, PITCH_DETECTOR, INSTRUMENT_DETECTORS, \
+    STRING_TRACKING, WATERFALL
 from core.chromatuna_engine import TunerEngine
+from core.drone import Drone
+from core.spectrogram import Spectrogram
 from core.string_tuner_window import StringTunerWindow
+from core.tuning_catalog import TuningIdentifier
 from gui.tuner_window import TunerWindow
 
 
@@ -20,10 +21,11 @@ class ChromaTuna(TunerEngine):
             tuner_engine.num_hps,
             tuner_engine.power_thresh,
             tuner_engine.white_noise_thresh,
-            tuner_engine.app
+            tuner_engine.app,
+            tuner_engine.channels,
+            BLOCK_SIZE  # small callback blocks, so the hop can follow the adaptive window
         )
         self.top = None
-        self.stream_thread = None
         self.closest_note_var = None
         self.freq_var = None
         self.pitch_var = None
@@ -32,24 +34,55 @@ class ChromaTuna(TunerEngine):
         self.freq_label = None
         self.pitch_label = None
         self.diff_label = None
-        self.fig_signal, self.ax_signal = plt.subplots(figsize=(4, 3))
-        self.fig_fft, self.ax_fft = plt.subplots(figsize=(4, 3))
-        self.signal_canvas = None
-        self.fft_canvas = None
-        self.fft_data = None
-        self.fft_freqs = None
+        self.tuning_label = None
+        self.plots = None
+        self.display_spectrum = True  # the FFT chart needs the spectrum whatever the detector
+        self.frame_rate = GUI_FRAME_RATE
+        # latest reading handed over from the analysis worker, drawn by render() on the Tk main loop
+        self.pending_update = None
+        self.rendered_hops = 0  # chart_hops drawn by the last render()
 
     def start_tuning(self):
-        if self.stream_thread is None or not self.stream_thread.is_alive():
-            self.stream_thread = threading.Thread(target=self.start_stream)
-            self.stream_thread.start()
+        # the stream runs on the audio and worker threads, starting it does not block the Tk loop
+        if self.source is None:
+            self.start_stream()
 
     def stop_tuning(self):
         self.stop_stream()
 
     def update_gui(self, note, freq, pitch, diff=0):
+        # called from the analysis worker - only hand the reading over, Tk widgets are touched in render()
         if self.running is False:
             return
+        self.pending_update = (note, freq, pitch, diff)
+
+    def schedule_render(self):
+        self.top.after(max(1, int(1000 / self.frame_rate)), self.render, self.top)
+
+    def render(self, top):
+        # frame loop of one tuner window - ends when the window is closed or replaced
+        if top is not self.top or not top.winfo_exists():
+            return
+        self.schedule_render()
+        update, self.pending_update = self.pending_update, None
+        if update is not None:
+            self.show_reading(top, *update)
+
+        # the charts follow every hop, silent ones included, so the spectrogram keeps scrolling
+        new_spectrum = self.chart_hops != self.rendered_hops
+        if update is None and not new_spectrum:
+            return
+        self.rendered_hops = self.chart_hops
+        if self.plots is None:
+            from gui.live_plots import LivePlots  # matplotlib is only loaded once a chart is shown
+
+            # the waterfall columns are pushed by the analysis worker, one per hop, the chart only draws them
+            self.spectrogram = Spectrogram(self.fft_freqs) if WATERFALL else None
+            self.plots = LivePlots(self.top, self.window_size, self.fft_freqs, self.spectrogram,
+                                   self.hop_size / self.sample_freq)
+        self.plots.render(self.window_samples, self.fft_data, new_spectrum)
+
+    def show_reading(self, top, note, freq, pitch, diff):
         if self.closest_note_label:
             self.closest_note_label.configure(text=f"Closest Note: {note}")
         if self.freq_label:
@@ -64,42 +97,41 @@ class ChromaTuna(TunerEngine):
                 self.diff_label.configure(text=f"Difference: {diff}")
             else:
                 self.diff_label.configure(text='')
-
-        if self.signal_canvas is None:
-            self.signal_canvas = FigureCanvasTkAgg(self.fig_signal, self.top)
-            self.signal_canvas.draw()
-            self.signal_canvas.get_tk_widget().pack(padx=5, pady=5)
-        self.ax_signal.clear()
-        self.ax_signal.plot(np.abs(self.window_samples))
-        self.ax_signal.set_title("Amplitude")
-        self.signal_canvas.draw()
-
-        if self.fft_canvas is None:
-            self.fft_canvas = FigureCanvasTkAgg(self.fig_fft, self.top)
-            self.fft_canvas.draw()
-            self.fft_canvas.get_tk_widget().pack(padx=50, pady=50)
-
-        self.ax_fft.clear()
-        nyquist_freq = self.sample_freq / 2
-        max_freq = 700  # set 700 as the max frequency - crop rest of the data.
-
-        # crop the FFT data to the max frequency.
-        start_idx = 0
-        end_idx = int(max_freq / (nyquist_freq / len(self.fft_freqs)))
-
-        self.ax_fft.semilogy(self.fft_freqs[start_idx:end_idx], self.fft_data[start_idx:end_idx])
-        self.ax_fft.set_xlim(0, max_freq)
-        self.ax_fft.set_title("FFT")
-        self.ax_fft.set_xlabel("Frequency (Hz)")
-        self.ax_fft.set_ylabel("Amplitude")
-        self.fft_canvas.draw()
-
-    def chromatic_tuning(self):
+        if self.identifier and self.identifier.match and self.tuning_label:
+            self.show_identified_tuning(*self.identifier.match)
+        if self.detector.target and isinstance(top, StringTunerWindow):
+            # string tuning - tracked deviation from the target string
+            top.show_deviation(self.detected_cents[0])
+
+    def show_identified_tuning(self, instrument, tuning, score):
+        # the closest tuning is selected right away, "Start Tuning" continues with it
+        self.app.instrument = instrument
+        self.app.tuning = tuning
+        name = self.app.tunings[instrument][tuning][0]['name']
+        strings = len(self.identifier.pitches)
+        self.tuning_label.configure(text=f"Tuning: {instrument.capitalize()} {name} ({strings} strings, "
+                                         f"{score:.0f} cents off)")
+
+    def chromatic_tuning(self, title="ChromaTuna"):
         print("Chromatic Tuner...")
+        with self.lock:  # a hop sees the old or the new settings, never half of them
+            self.set_noise_bands(OCTAVE_BANDS)
+            self.set_frequency_range()
+            self.reset_window()
+            self.set_target(None)
+            self.set_detector(PITCH_DETECTOR)
+        self.identifier = None
+        self.tuning_label = None
+        if self.drone:
+            # no reference tone in the chromatic tuner - and no duplex stream for an idle one
+            self.drone.stop()
+            self.drone = None
         x, y = self.app.master.winfo_x(), self.app.master.winfo_y()
-        self.top = TunerWindow(self.app.master, "ChromaTuna", "+%d+%d" % (x + 50, y + 50))
+        self.top = TunerWindow(self.app.master, title, "+%d+%d" % (x + 50, y + 50))
         # self.top.geometry("400x300")
         self.top.geometry("600x1400")
+        self.plots = None
+        self.schedule_render()
         self.closest_note_label = ctk.CTkLabel(self.top, text="Closest Note: -", font=("Verdana", 14))
         self.freq_label = ctk.CTkLabel(self.top, text="Freq: -", font=("Verdana", 14))
         self.pitch_label = ctk.CTkLabel(self.top, text="Target Pitch: -", font=("Verdana", 14))
@@ -134,10 +166,31 @@ class ChromaTuna(TunerEngine):
         start_button.pack(padx=5, pady=5)
         stop_button.pack(padx=5, pady=5)
 
+    def identify_tuning(self):
+        # chromatic tuner that collects the strings strummed one by one and matches them against every tuning
+        self.chromatic_tuning("Identify Tuning")
+        self.identifier = TuningIdentifier(self.app.catalog)
+        self.tuning_label = ctk.CTkLabel(self.top, text="Tuning: strum the open strings one by one",
+                                         font=("Verdana", 14))
+        self.tuning_label.pack(before=self.closest_note_label)
+
     def full_tuning(self):
         tuning_data = self.app.tunings[self.app.instrument][self.app.tuning][0]
+        self.identifier = None
         string_order = list(tuning_data['tuning'].keys())
         target_freq = list(tuning_data['tuning'].values())[0]
+        with self.lock:
+            self.set_noise_bands(BASS_BANDS if self.app.instrument == 'bass' else OCTAVE_BANDS)
+            self.set_tuning_range(list(tuning_data['tuning'].values()))
+            self.set_strings(tuning_data['tuning'])
+            if STRING_TRACKING:
+                self.set_detector('goertzel')
+            else:
+                self.set_detector(INSTRUMENT_DETECTORS.get(self.app.instrument, PITCH_DETECTOR))
+            self.set_target(target_freq)
+        if self.drone:
+            self.drone.stop()
+        self.drone = Drone(self.app.instrument, self.sample_freq, self.block_size)
 
         self.top = StringTunerWindow(
             self.app.master,
@@ -150,3 +203,5 @@ class ChromaTuna(TunerEngine):
             self.app.tuner_engine
         )
         self.top.grab_set()
+        self.plots = None
+        self.schedule_render()
@@ -1,114 +1,525 @@
 # core/chromatuna_engine.py
 
+import threading
 import numpy as np
-import sounddevice as sd
-import scipy.fftpack
-import time
-import copy
+from time import perf_counter
 
 # importing variables from __init__.py
-from core import SAMPLE_FREQ, WINDOW_SIZE, NUM_HPS, CONCERT_PITCH, WHITE_NOISE_THRESH, \
-    DELTA_FREQ, OCTAVE_BANDS, ALL_NOTES
+from core import MIN_FREQ, MAX_FREQ, TUNING_MARGIN, MAX_QUEUED_HOPS, METRICS_FILE, \
+    METRICS_INTERVAL, PROFILE_SLOWEST_HOPS, PITCH_DETECTOR, PHASE_VOCODER, OCTAVE_BANDS, ADAPTIVE_WINDOW, \
+    WINDOW_PERIODS, MIN_WINDOW_SIZE, HOPS_PER_WINDOW, DUAL_WINDOW, DUAL_AGREE_CENTS, DUAL_STEADY_HOPS, \
+    TRACKER_STABLE, RECORD_DIR
+from core.ring_buffer import RingBuffer
+from core.note_table import NoteTable
+from core.pitch_tracker import PitchTracker
+from core.analysis_chain import SpectralChain
+from core.hps import HarmonicProductSpectrum
+from core.time_domain import AutocorrelationDetector, YinDetector, McLeodDetector
+from core.goertzel import GoertzelBank
+from core.analysis_worker import HopQueue, AnalysisWorker
+from core.audio_sources import DeviceSource
+from core.metrics import EngineMetrics, MetricsReporter, write_snapshot
+from core.recorder import SessionRecorder
+
+DETECTORS = {
+    'hps': HarmonicProductSpectrum,
+    'autocorr': AutocorrelationDetector,
+    'yin': YinDetector,
+    'mpm': McLeodDetector,
+    'goertzel': GoertzelBank,
+}
 
 
 class TunerEngine:
 
-    def __init__(self, sample_freq, window_size, window_step, num_hps, power_thresh, white_noise_thresh, app):
+    def __init__(self, sample_freq, window_size, window_step, num_hps, power_thresh, white_noise_thresh, app,
+                 channels=1, block_size=None, shared_chains=None):
         self.sample_freq = sample_freq
-        self.window_size = window_size
+        self.window_size = window_size  # longest analysis window - the ring buffer holds this much audio
         self.window_step = window_step
+        self.block_size = block_size or window_step  # frames per audio callback
         self.num_hps = num_hps
         self.power_thresh = power_thresh
         self.white_noise_thresh = white_noise_thresh
-        self.window_samples = [0 for _ in range(window_size)]
-        self.note_buffer = ["1", "2"]
+        self.channels = channels
+        # one window per input channel in a single 2D buffer, the charts show the first channel
+        self.ring_buffer = RingBuffer(window_size, channels)
+        self.channel_windows = self.ring_buffer.window()
+        self.window_samples = self.channel_windows[0]
+        # float32 like the stream - a float64 output would make einsum cast the whole window on every hop
+        self.signal_power = np.zeros(channels, dtype=np.float32)
+        self.tracker = PitchTracker(channels)  # smooths the readings of every channel over the hops
         self.running = False
-        self.hann_window = np.hanning(self.window_size)
+        self.source = None  # AudioSource of the running stream
+        self.stream_lock = threading.Lock()
+        # held by process_hop and the setters - the Tk thread changes settings between hops, never inside one
+        self.lock = threading.RLock()
+        self.stopped = threading.Event()  # set once the stream is fully down
+        self.stopped.set()
+        self.driving_drone = False  # the drone renders into the duplex stream of the tuner
+        self.min_freq = MIN_FREQ
+        self.max_freq = MAX_FREQ
+        self.target_freq = None  # string being tuned in full tuning, None in chromatic mode
+        self.noise_bands = OCTAVE_BANDS
+        self.detector_name = PITCH_DETECTOR
+        self.detector = None
+        # spectral stages per analysis window size, the active one is picked by set_window
+        self.chains = {}
+        self.short_chain = None  # quarter length window of the dual window mode
+        self.short_freqs = np.full(channels, np.nan)  # last short window reading per channel
+        self.short_steady = np.zeros(channels, dtype=np.intp)  # hops the short window has agreed with itself
+        self.adapt_window = ADAPTIVE_WINDOW
+        self.dual_window = DUAL_WINDOW
+        self.pending_frames = 0  # frames buffered since the last analysed hop
+        self.analysed_hops = 0  # hops that went through the detector or were rejected as too weak
+        # chains of other engines on the same thread, forked instead of rebuilt - e.g. the sessions of a server worker
+        self.shared_chains = shared_chains
+        self.set_window(window_size, window_step)
+        self.detector = self.create_detector(PITCH_DETECTOR)
+        self.display_spectrum = False  # keep computing the spectrum for charts when a time domain detector runs
+        self.chart_hops = 0  # hops that refreshed the chart spectrum fft_data
+        self.spectrogram = None  # Spectrogram of the chart spectrum, gets a column on every chart hop
+        self.refine_phase = PHASE_VOCODER  # refine spectral readings with the phase vocoder of the chain
+        self.dropped_blocks = 0  # blocks the worker knows were dropped - a new drop breaks the phase continuity
+        # the queue holds MAX_QUEUED_HOPS hops worth of callback blocks
+        self.hop_queue = HopQueue(self.block_size, MAX_QUEUED_HOPS * -(-window_step // self.block_size), channels)
+        self.analysis_worker = None
+        self.last_status = None
+        self.last_result = None  # (note, freq, pitch, diff) of the latest detection on the first channel
+        self.channel_results = [None] * channels  # latest (note, freq, pitch, diff) or None per channel
+        self.detected_freqs = np.full(channels, np.nan)  # unrounded detector output per channel
+        self.tracked_freqs = np.full(channels, np.nan)  # detector output smoothed by the tracker per channel
+        self.detected_cents = np.full(channels, np.nan)  # deviation of each tracked channel from its note in cents
+        self.note_table = NoteTable()
+        self.verbose = True  # print readings and weak signal warnings to the console
+        self.metrics = EngineMetrics(self.block_size / sample_freq, PROFILE_SLOWEST_HOPS)
+        self.metrics_path = METRICS_FILE  # a metrics snapshot is dumped here every METRICS_INTERVAL seconds
+        self.metrics_reporter = None
+        self.record_dir = RECORD_DIR  # every stream is recorded to a new session directory in here
+        self.recorder = None  # SessionRecorder of the running stream, or SessionReplay while replaying one
+        self.drone = None  # reference drone rendered in the same duplex stream as the input
+        self.identifier = None  # TuningIdentifier fed with the first channel while identifying the tuning
         self.app = app
 
     def find_closest_note(self, pitch):
-        i = int(np.round(np.log2(pitch / CONCERT_PITCH) * 12))
-        closest_note = ALL_NOTES[i % 12] + str(4 + (i + 9) // 12)
-        closest_pitch = CONCERT_PITCH * 2 ** (i / 12)
-        return closest_note, closest_pitch
+        return self.note_table.closest_note(pitch)
 
     def audio_callback(self, indata, frames, time_info, status):
+        # runs on the PortAudio thread - only copy the block, the analysis worker does the rest.
+        # over/underflow flags are counted, the block itself is still valid and gets analysed.
+        start = perf_counter()
+        flags = 0
         if status:
-            print(status)
-            return
-        if any(indata):
-            self.window_samples = np.concatenate((self.window_samples, indata[:, 0]))
-            self.window_samples = self.window_samples[len(indata[:, 0]):]
-
-            signal_power = (np.linalg.norm(self.window_samples, ord=2) ** 2) / len(self.window_samples)
-            if signal_power < self.power_thresh:
-                print(f"Signal is too weak, check your connection: {signal_power} . Need at least {self.power_thresh}")
-                return
-
-            hann_samples = self.window_samples * self.hann_window
-            # save fft data for charts visualisation.
-            self.fft_data = np.abs(np.fft.rfft(hann_samples))
-            self.fft_freqs = np.fft.rfftfreq(len(hann_samples), 1 / self.sample_freq)
-
-            magnitude_spec = abs(scipy.fftpack.fft(hann_samples)[:len(hann_samples) // 2])
-
-            for i in range(int(16 / DELTA_FREQ)):
-                magnitude_spec[i] = 0
-
-            for j in range(len(OCTAVE_BANDS) - 1):
-                ind_start = int(OCTAVE_BANDS[j] / DELTA_FREQ)
-                ind_end = int(OCTAVE_BANDS[j + 1] / DELTA_FREQ)
-                ind_end = ind_end if len(magnitude_spec) > ind_end else len(magnitude_spec)
-                avg_energy_per_freq = (np.linalg.norm(magnitude_spec[ind_start:ind_end], ord=2) ** 2) / (
-                        ind_end - ind_start)
-                avg_energy_per_freq = avg_energy_per_freq ** 0.5
-                for i in range(ind_start, ind_end):
-                    magnitude_spec[i] = magnitude_spec[i] if magnitude_spec[
-                                                                 i] > WHITE_NOISE_THRESH * avg_energy_per_freq else 0
-
-            mag_spec_ipol = np.interp(np.arange(0, len(magnitude_spec), 1 / NUM_HPS),
-                                      np.arange(0, len(magnitude_spec)),
-                                      magnitude_spec)
-            mag_spec_ipol = mag_spec_ipol / np.linalg.norm(mag_spec_ipol, ord=2)
-
-            hps_spec = copy.deepcopy(mag_spec_ipol)
-
-            for i in range(NUM_HPS):
-                tmp_hps_spec = np.multiply(hps_spec[:int(np.ceil(len(mag_spec_ipol) / (i + 1)))],
-                                           mag_spec_ipol[::(i + 1)])
-                if not any(tmp_hps_spec):
-                    break
-                hps_spec = tmp_hps_spec
-            self.fft_data = hps_spec
-            max_ind = np.argmax(hps_spec)
-            max_freq = max_ind * (SAMPLE_FREQ / WINDOW_SIZE) / NUM_HPS
-
-            closest_note, closest_pitch = self.find_closest_note(max_freq)
-            max_freq = round(max_freq, 1)
-            closest_pitch = round(closest_pitch, 1)
-
-            self.note_buffer.insert(0, closest_note)
-            self.note_buffer.pop()
-
-            if self.note_buffer.count(self.note_buffer[0]) == len(self.note_buffer):
-                print(f"Closest note: {closest_note} {max_freq}/{closest_pitch}: {signal_power}")
-            self.update_gui(closest_note, max_freq, closest_pitch, (max_freq - closest_pitch))
+            self.last_status = status
+            flags = getattr(status, 'input_overflow', False) | getattr(status, 'input_underflow', False) << 1
+        self.hop_queue.put(indata, start, getattr(time_info, 'inputBufferAdcTime', np.nan), flags)
+        self.metrics.record_callback(perf_counter() - start, frames, status, self.sample_freq)
+
+    def feed(self, indata, frames, time_info, status):
+        # callback of sources without an audio clock - every block is analysed before the next one is read,
+        # so a file or buffer runs as fast as the analysis and no hop is ever dropped
+        self.audio_callback(indata, frames, time_info, status)
+        samples = self.hop_queue.get(timeout=0)
+        if samples is not None:
+            self.process_hop(samples)
+
+    def process_hop(self, samples):
+        # samples: (frames,) or (frames, channels). returns the reading of the first channel,
+        # the readings of every channel are published in channel_results.
+        with self.lock:
+            recorder = self.recorder
+            if recorder:
+                recorder.record_block(samples)
+            self.metrics.start_hop()
+            try:
+                return self.analyze_hop(samples)
+            finally:
+                self.metrics.end_hop()
+                if recorder:
+                    recorder.record_results()
+
+    def analyze_hop(self, samples):
+        # consecutive spectra are only comparable when no block was skipped in between
+        if self.hop_queue.dropped_blocks != self.dropped_blocks:
+            self.dropped_blocks = self.hop_queue.dropped_blocks
+            self.break_continuity()
+        if not np.count_nonzero(samples):
+            self.channel_results = [None] * self.channels
+            self.tracker.miss()
+            return self.break_continuity()
+        lap = self.metrics.hop_start
+        # write the new block in place - the windows are only analysed once a whole hop has arrived
+        self.ring_buffer.write(samples)
+        self.pending_frames += len(samples)
+        if self.pending_frames < self.hop_size:
+            self.metrics.lap('buffering', lap)
+            return None
+        hop, self.pending_frames = self.pending_frames, 0
+        self.analysed_hops += 1
+        self.channel_results = [None] * self.channels
+        self.channel_windows = self.ring_buffer.window()
+        self.window_samples = self.channel_windows[0]
+
+        # detectors only need (and only judge the power of) the newest part of the ring buffer
+        spectral = self.detector.domain == 'spectrum'
+        analysed = self.channel_windows[:, -(self.analysis_size if spectral else self.detector.window_size):]
+        np.einsum('ij,ij->i', analysed, analysed, out=self.signal_power)
+        self.signal_power /= analysed.shape[-1]
+        loud = self.signal_power >= self.power_thresh
+        lap = self.metrics.lap('buffering', lap)
+        if not loud.any():
+            self.metrics.power_rejections += 1
+            self.tracker.miss()
+            if self.verbose:
+                print(f"Signal is too weak, check your connection: {self.signal_power.max()} . "
+                      f"Need at least {self.power_thresh}")
+            return self.break_continuity()
+
+        if spectral:
+            max_freqs, lap = self.detect_spectrum(self.chain, hop, lap)
+            if self.short_chain:
+                # the short window follows a new string while the long one still holds the old note. it is trusted
+                # on its own steadiness - once it agrees with itself over a few hops but not with the long window.
+                # when both agree the long window's reading is the more precise one.
+                short_freqs, lap = self.detect_spectrum(self.short_chain, hop, lap)
+                with np.errstate(invalid='ignore'):
+                    steady = np.abs(1200 * np.log2(short_freqs / self.short_freqs)) <= DUAL_AGREE_CENTS
+                    agree = np.abs(1200 * np.log2(short_freqs / max_freqs)) <= DUAL_AGREE_CENTS
+                self.short_steady = np.where(steady, self.short_steady + 1, 0)
+                self.short_freqs = short_freqs
+                max_freqs = np.where((self.short_steady >= DUAL_STEADY_HOPS) & ~agree, short_freqs, max_freqs)
+        else:
+            if self.display_spectrum:
+                lap = self.transform(self.chain, lap)
+            self.break_continuity()
+            if self.detector.domain == 'block':
+                # block detectors only run the new hop through their filters
+                max_freqs = self.detector.detect(self.channel_windows, hop)
+            else:
+                max_freqs = self.detector.detect(self.channel_windows)
+        self.detected_freqs = max_freqs
+        lap = self.metrics.lap('detector', lap)
+
+        channel_results = self.channel_results
+        found = loud & ~np.isnan(max_freqs)
+        # readings are tracked in cents from the reference - outliers are dropped, a new string restarts the track,
+        # and a tracked note is held through a few hops without a reading
+        with np.errstate(invalid='ignore'):
+            readings = 1200 * np.log2(np.where(found, max_freqs, np.nan) / self.note_table.reference)
+        tracked = self.tracker.update(readings)
+        self.tracked_freqs = self.note_table.reference * 2 ** (tracked / 1200)
+        tracking = ~np.isnan(tracked)
+        # every channel in one table lookup - a targeted detector reports against its string, even when it is
+        # closer to the next note
+        lookup_freqs = np.where(tracking, self.detector.target or self.tracked_freqs, self.note_table.reference)
+        notes, pitches, _ = self.note_table.lookup(lookup_freqs)
+        if self.detector.target:
+            pitches = np.full(self.channels, float(self.detector.target))
+        self.detected_cents = np.where(tracking, 1200 * np.log2(self.tracked_freqs / pitches), np.nan)
+        if self.identifier:
+            self.identifier.add(max_freqs[0] if found[0] else np.nan)
+        for channel in np.flatnonzero(tracking):
+            closest_note = str(self.note_table.names[notes[channel]])
+            # the difference comes from the unrounded frequencies, rounding both to 0.1Hz costs cents
+            diff = round(float(self.tracked_freqs[channel] - pitches[channel]), 2)
+            max_freq = round(float(self.tracked_freqs[channel]), 1)
+            closest_pitch = round(float(pitches[channel]), 1)
+
+            if self.verbose and self.tracker.confidence[channel] >= TRACKER_STABLE:
+                prefix = f"Channel {channel}: " if self.channels > 1 else ""
+                print(f"{prefix}Closest note: {closest_note} {max_freq}/{closest_pitch}: "
+                      f"{self.signal_power[channel]}")
+            channel_results[channel] = (closest_note, max_freq, closest_pitch, diff)
+        lap = self.metrics.lap('note_lookup', lap)
+
+        if channel_results[0] is None:
+            return None
+        self.last_result = channel_results[0]
+        self.update_gui(*self.last_result)
+        self.metrics.lap('gui_dispatch', lap)
+        return self.last_result
+
+    def transform(self, chain, lap):
+        # one FFT per hop for all channels - the front end keeps the chart data and returns a work copy.
+        chain.front_end.apply_window(self.channel_windows[:, -chain.window_size:])
+        lap = self.metrics.lap('windowing', lap)
+        chain.front_end.transform()
+        if chain is self.chain:
+            spectrogram = self.spectrogram
+            if spectrogram is not None:
+                spectrogram.push(self.fft_data)
+            self.chart_hops += 1
+        return self.metrics.lap('fft', lap)
+
+    def detect_spectrum(self, chain, hop, lap):
+        lap = self.transform(chain, lap)
+        magnitude_spec = chain.front_end.detection_spec
+        # suppress white noise - cut off everything under 16Hz and gate each band against its rms.
+        chain.noise_gate.apply(magnitude_spec)
+        lap = self.metrics.lap('noise_gate', lap)
+        # spectral detectors (HPS) search the gated spectrum over the searched range
+        max_freqs = self.spectral_detector(chain).detect(magnitude_spec)
+        if self.refine_phase and chain.refine_phase:
+            max_freqs = chain.phase_vocoder.refine(chain.front_end.spectrum, chain.front_end.magnitude, max_freqs,
+                                                   hop)
+        return max_freqs, lap
+
+    def break_continuity(self):
+        # the next spectrum does not follow the last one, returns None for the early exits of analyze_hop
+        for chain in self.chains.values():
+            chain.phase_vocoder.reset()
+        return None
+
+    def reset_analysis(self):
+        # forget the buffered audio, e.g. before a new stream or file
+        with self.lock:
+            self.ring_buffer.clear()
+            self.pending_frames = 0
+            self.short_freqs[:] = np.nan
+            self.short_steady[:] = 0
+            self.tracker.reset()
+            self.break_continuity()
+
+    def metrics_snapshot(self):
+        return self.metrics.snapshot(self.hop_queue.dropped_blocks)
+
+    def dump_metrics(self, path):
+        write_snapshot(self.metrics_snapshot(), path)
+
+    def enable_profiling(self, slowest_hops):
+        # keep the stage breakdown of the slowest hops in the metrics snapshot
+        self.metrics.slowest_hops = slowest_hops
+        self.metrics.slowest = []
+
+    def set_noise_bands(self, bands):
+        with self.lock:
+            self.noise_bands = bands
+            for chain in (self.chain, self.short_chain):
+                if chain:
+                    chain.set_noise_bands(bands)
+            self.noise_gate = self.chain.noise_gate
+
+    def spectral_chain(self, window_size):
+        chain = self.chains.get(window_size)
+        if chain is None:
+            key = (window_size, self.sample_freq, self.num_hps, self.white_noise_thresh, self.channels)
+            shared = self.shared_chains.get(key) if self.shared_chains is not None else None
+            if shared is not None:
+                chain = shared.fork()
+            else:
+                chain = SpectralChain(window_size, self.sample_freq, self.num_hps, self.white_noise_thresh,
+                                      self.noise_bands, self.channels)
+                if self.shared_chains is not None:
+                    self.shared_chains[key] = chain
+            self.chains[window_size] = chain
+        chain.set_noise_bands(self.noise_bands)
+        return chain
+
+    def spectral_detector(self, chain):
+        # the active spectral detector built for the bin width of the chain, cached in the chain
+        detector = chain.detectors.get(self.detector_name)
+        if detector is None:
+            detector = DETECTORS[self.detector_name](chain.front_end.delta_freq, chain.window_size // 2,
+                                                     self.num_hps, self.min_freq, self.max_freq, self.channels)
+            chain.detectors[self.detector_name] = detector
+        elif (detector.min_freq, detector.max_freq) != (self.min_freq, self.max_freq):
+            detector.set_range(self.min_freq, self.max_freq)
+        return detector
+
+    def set_window(self, window_size, window_step):
+        # analysis window and hop in samples. the window is capped by the ring buffer, the hop is collected from
+        # whole callback blocks. the spectral stages of each size are built once and reused.
+        with self.lock:
+            window_size = min(window_size, self.window_size)
+            self.analysis_size = window_size
+            self.hop_size = window_step
+            self.chain = self.spectral_chain(window_size)
+            short_size = window_size // 4
+            dual = self.dual_window and short_size >= MIN_WINDOW_SIZE
+            self.short_chain = self.spectral_chain(short_size) if dual else None
+            self.spectral_front_end = self.chain.front_end
+            self.noise_gate = self.chain.noise_gate
+            self.phase_vocoder = self.chain.phase_vocoder
+            # fft data for charts visualisation - filled in place on every hop.
+            self.fft_data = self.spectral_front_end.magnitude[0]
+            self.fft_freqs = self.spectral_front_end.freqs
+            self.spectrogram = None  # resampled for the bins of the previous window
+            if self.detector is not None and self.detector.domain == 'spectrum':
+                self.detector = self.spectral_detector(self.chain)
+            self.break_continuity()
+
+    def adaptive_window(self, min_freq):
+        # WINDOW_PERIODS periods of the lowest searched frequency, rounded up to a power of two for the FFT
+        window_size = 1 << int(np.ceil(np.log2(WINDOW_PERIODS * self.sample_freq / min_freq)))
+        window_size = int(np.clip(window_size, MIN_WINDOW_SIZE, self.window_size))
+        return window_size, window_size // HOPS_PER_WINDOW
+
+    def create_detector(self, name):
+        detector_class = DETECTORS[name]
+        self.detector_name = name
+        if detector_class.domain == 'spectrum':
+            detector = self.spectral_detector(self.chain)
+        elif detector_class.domain == 'block':
+            detector = detector_class(self.sample_freq, self.num_hps, self.min_freq, self.max_freq, self.channels)
+        else:
+            detector = detector_class(self.sample_freq, self.min_freq, self.max_freq, self.channels, self.window_size)
+        detector.set_target(self.target_freq)
+        return detector
+
+    def set_detector(self, name):
+        # all detectors share the ring buffer, switching keeps the buffered audio
+        with self.lock:
+            if name != self.detector_name or self.detector is None:
+                self.detector = self.create_detector(name)
+
+    def set_target(self, frequency):
+        # string being tuned - targeted detectors switch to it on the next hop, None goes back to chromatic
+        with self.lock:
+            self.target_freq = frequency
+            self.detector.set_target(frequency)
+
+    def set_reference(self, reference, temperament='equal'):
+        # a4 reference pitch (e.g. 432 or 442Hz) and temperament of the note names, keeps the tuning's strings
+        with self.lock:
+            strings = dict(zip(self.note_table.string_names, self.note_table.string_pitches))
+            self.note_table = NoteTable(reference, temperament)
+            if strings:
+                self.note_table.set_strings(strings)
+
+    def settings(self):
+        # the settings a hop depends on, recorded with a session so a replay analyses it the same way
+        return {
+            'detector': self.detector_name,
+            'window': self.analysis_size,
+            'hop': self.hop_size,
+            'dual_window': self.dual_window,
+            'min_freq': float(self.min_freq),
+            'max_freq': float(self.max_freq),
+            'target': None if self.target_freq is None else float(self.target_freq),
+            'reference': float(self.note_table.reference),
+            'temperament': self.note_table.temperament,
+            'noise_bands': list(self.noise_bands),
+            'refine_phase': self.refine_phase,
+        }
+
+    def apply_settings(self, settings):
+        # only what changed is applied - a window or detector set again would still break the phase continuity
+        with self.lock:
+            current = self.settings()
+            if (settings['reference'], settings['temperament']) != (current['reference'], current['temperament']):
+                self.set_reference(settings['reference'], settings['temperament'])
+            if settings['detector'] != current['detector']:
+                self.set_detector(settings['detector'])
+            self.dual_window = settings['dual_window']
+            if (settings['window'], settings['hop'], settings['dual_window']) != \
+                    (current['window'], current['hop'], current['dual_window']):
+                self.set_window(settings['window'], settings['hop'])
+            if (settings['min_freq'], settings['max_freq']) != (current['min_freq'], current['max_freq']):
+                self.set_frequency_range(settings['min_freq'], settings['max_freq'])
+            if settings['target'] != current['target']:
+                self.set_target(settings['target'])
+            if settings['noise_bands'] != current['noise_bands']:
+                self.set_noise_bands(settings['noise_bands'])
+            self.refine_phase = settings['refine_phase']
+
+    def set_strings(self, strings):
+        # {name: frequency} of the selected tuning for note_table.nearest_string
+        with self.lock:
+            self.note_table.set_strings(strings)
+
+    def set_frequency_range(self, min_freq=MIN_FREQ, max_freq=MAX_FREQ):
+        with self.lock:
+            self.min_freq = min_freq
+            self.max_freq = max_freq
+            self.detector.set_range(min_freq, max_freq)
+
+    def set_tuning_range(self, frequencies):
+        # only search around the strings of the selected tuning
+        with self.lock:
+            margin = 2 ** (TUNING_MARGIN / 12)
+            self.set_frequency_range(min(frequencies) / margin, max(frequencies) * margin)
+            if self.adapt_window:
+                # a ukulele does not need the one second window of a bass E1
+                self.set_window(*self.adaptive_window(self.min_freq))
+
+    def reset_window(self):
+        # back to the configured window and hop, e.g. for the chromatic tuner
+        with self.lock:
+            self.set_window(self.window_size, self.window_step)
 
     def update_gui(self, note, freq, pitch, diff):
         pass
 
-    def start_stream(self):
-        self.running = True
+    def start_stream(self, source=None):
+        # starts the audio source and returns right away, the readings arrive through update_gui.
+        # without a source the default input device is opened - in a duplex stream with the drone when there is one.
+        # a running stream is stopped first, so a quick restart never races the old one.
+        self.stop_stream()
+        if source is None:
+            # only a sounding drone needs the output device, otherwise the input opens on its own
+            sounding = self.drone is not None and self.drone.sounding
+            source = DeviceSource(self.sample_freq, self.channels, self.block_size,
+                                  self.drone.callback if sounding else None)
+            if sounding:
+                # the drone moves from its own output stream into the duplex stream of the tuner
+                self.drone.stop_output()
+                self.drone.driven = self.driving_drone = True
         print("Starting tuner...")
+        self.running = True
+        self.stopped.clear()
+        self.hop_queue.clear()
+        self.dropped_blocks = 0
+        self.reset_analysis()
+        self.metrics.reset()
+        if self.metrics_path:
+            self.metrics_reporter = MetricsReporter(self, self.metrics_path, METRICS_INTERVAL)
+            self.metrics_reporter.start()
+        if self.record_dir:
+            self.recorder = SessionRecorder(self, self.record_dir)
+        callback = self.feed
+        if source.realtime:
+            # the audio clock does not wait for the analysis - the callback only queues, the worker analyses
+            self.analysis_worker = AnalysisWorker(self, self.hop_queue)
+            self.analysis_worker.start()
+            callback = self.audio_callback
+        self.source = source
         try:
-            with sd.InputStream(channels=1, callback=self.audio_callback, blocksize=self.window_step,
-                                samplerate=self.sample_freq):
-                while self.running:
-                    time.sleep(2)
+            # a source that runs out stops the stream by itself
+            source.start(callback, self.stop_stream)
         except Exception as exc:
             print(str(exc))
+            self.stop_stream()
+            return
+        if self.driving_drone and not source.output:
+            # the duplex stream could not be opened and the source fell back to input only - the drone stays silent
+            self.drone.driven = self.driving_drone = False
 
     def stop_stream(self):
+        # tears the stream down and returns once the source and the worker are gone - safe to call from any thread,
+        # only the first caller does the work
+        with self.stream_lock:
+            source, self.source = self.source, None
+        if source is None:
+            return
         self.running = False
+        source.stop()
+        if self.analysis_worker:
+            self.analysis_worker.stop()
+            self.analysis_worker = None
+        if self.driving_drone:
+            self.drone.driven = self.driving_drone = False
+            if self.drone.sounding:
+                self.drone.start_output()
+        if self.metrics_reporter:
+            self.metrics_reporter.stop()
+            self.metrics_reporter = None
+        if self.recorder:
+            self.recorder.close()
+            self.recorder = None
         self.update_gui('-', '0.00', '0.00', 0)
-        print("Stopping tuner...")
+        print(f"Stopping tuner... ({self.hop_queue.dropped_blocks} blocks dropped)")
+        self.stopped.set()
+
+    def wait(self, timeout=None):
+        # blocks until the stream stopped, e.g. until a file source ran out. True if it did within the timeout
+        return self.stopped.wait(timeout)
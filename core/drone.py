@@ -0,0 +1,152 @@
+# core/drone.py
+
+import numpy as np
+
+from core import SAMPLE_FREQ, BLOCK_SIZE, DRONE_LEVEL, DRONE_GLIDE
+from core.sound_generator import INSTRUMENT_PROFILES, DEFAULT_PROFILE, FUNDAMENTAL_AMP
+
+# envelope states, each one ramps the level to its target and hands over to the next state
+ATTACK, DECAY, SUSTAIN, RELEASE, OFF = 'attack', 'decay', 'sustain', 'release', 'off'
+
+
+class Drone:
+    # endless reference tone rendered block by block in the output stream callback.
+    # every partial keeps a phase accumulator in cycles, so blocks join without clicks and a frequency change
+    # glides instead of restarting the tone. all buffers are allocated once for the block size.
+    def __init__(self, instrument='guitar', sample_rate=SAMPLE_FREQ, block_size=BLOCK_SIZE, inharmonicity=0.0):
+        profile = INSTRUMENT_PROFILES.get(instrument, DEFAULT_PROFILE)
+        self.sample_rate = sample_rate
+        self.attack = profile['attack']
+        self.decay = profile['decay']
+        self.sustain = profile['sustain']
+        self.release_time = profile['release']
+        numbers = np.arange(1, len(profile['harmonic_amps']) + 2)
+        self.ratios = numbers * np.sqrt(1 + inharmonicity * numbers ** 2)
+        self.ratios[0] = 1
+        amps = np.array([FUNDAMENTAL_AMP] + profile['harmonic_amps'], dtype=np.float32)
+        self.amps = amps * np.float32(DRONE_LEVEL / amps.sum())
+        self.phases = np.zeros(len(amps))
+        self.freq = 0.0
+        self.target_freq = 0.0
+        self.state = OFF
+        self.level = 0.0
+        self.stream = None  # own output stream, unused while the tuner's duplex stream renders the drone
+        self.driven = False  # True while a TunerEngine stream calls callback()
+        self.allocate(block_size)
+
+    def allocate(self, block_size):
+        self.block_size = block_size
+        self.ramp = np.arange(block_size + 1, dtype=np.float64)
+        self.cycles = np.zeros((len(self.amps), block_size))
+        self.sines = np.zeros((len(self.amps), block_size), dtype=np.float32)
+        self.envelope = np.zeros(block_size, dtype=np.float32)
+        self.block = np.zeros(block_size, dtype=np.float32)
+
+    @property
+    def sounding(self):
+        return self.state != OFF
+
+    def play(self, frequency):
+        # (re)start the tone - a running tone glides to the new frequency without a new attack,
+        # a releasing one attacks again from its current level
+        if not self.sounding:
+            self.freq = frequency
+        if self.state in (RELEASE, OFF):
+            self.state = ATTACK
+        self.target_freq = frequency
+        if not self.driven:
+            self.start_output()
+
+    def set_frequency(self, frequency):
+        self.target_freq = frequency
+
+    def release(self):
+        if self.sounding:
+            self.state = RELEASE
+
+    def render(self, frames):
+        # renders the next `frames` samples into self.block and returns a view of them
+        if frames > self.block_size:
+            self.allocate(frames)
+        block = self.block[:frames]
+        if not self.sounding:
+            block[:] = 0
+            return block
+
+        # exponential glide towards the target, the frequency ramps linearly across the block
+        start_freq = self.freq
+        end_freq = self.target_freq + (start_freq - self.target_freq) * np.exp(
+            -frames / (DRONE_GLIDE * self.sample_rate))
+        slope = (end_freq - start_freq) / frames
+        # cycles of the fundamental before each sample: n f0 + slope n (n - 1) / 2
+        ramp = self.ramp[:frames]
+        cycles = self.cycles[:, :frames]
+        np.multiply(ramp, ramp, out=cycles[0])
+        cycles[0] -= ramp
+        cycles[0] *= slope / 2
+        cycles[0] += start_freq * ramp
+        cycles[0] /= self.sample_rate
+        np.multiply(self.ratios[:, None], cycles[0], out=cycles)
+        cycles += self.phases[:, None]
+        cycles -= np.rint(cycles)
+
+        total = (frames * start_freq + slope * frames * (frames - 1) / 2) / self.sample_rate
+        self.phases += self.ratios * total
+        self.phases -= np.rint(self.phases)
+        self.freq = end_freq
+
+        sines = self.sines[:, :frames]
+        np.multiply(cycles, 2 * np.pi, out=sines, casting='same_kind')
+        np.sin(sines, out=sines)
+        np.matmul(self.amps, sines, out=block)
+        block *= self.advance_envelope(frames)
+        return block
+
+    def advance_envelope(self, frames):
+        # per sample envelope of the block, crossing as many states as fit into it
+        envelope = self.envelope[:frames]
+        pos = 0
+        while pos < frames:
+            if self.state in (SUSTAIN, OFF):
+                envelope[pos:] = self.level
+                break
+            target, duration, next_state = {
+                ATTACK: (1.0, self.attack, DECAY),
+                DECAY: (self.sustain, self.decay, SUSTAIN),
+                RELEASE: (0.0, self.release_time, OFF),
+            }[self.state]
+            full_range = 1.0 if self.state == ATTACK else (1 - self.sustain if self.state == DECAY else self.sustain)
+            rate = full_range / max(duration * self.sample_rate, 1) * np.sign(target - self.level)
+            remaining = int(np.ceil(abs(target - self.level) / abs(rate))) if rate else 0
+            count = min(remaining, frames - pos)
+            np.multiply(self.ramp[1:count + 1], rate, out=envelope[pos:pos + count], casting='same_kind')
+            envelope[pos:pos + count] += self.level
+            self.level += rate * count
+            pos += count
+            if count == remaining:
+                self.level = target
+                self.state = next_state
+        return envelope
+
+    def callback(self, outdata, frames, time_info, status):
+        # output stream callback - one mono block copied to every output channel
+        outdata[:] = self.render(frames)[:, None]
+
+    def start_output(self):
+        import sounddevice as sd
+
+        if self.stream is None:
+            self.stream = sd.OutputStream(samplerate=self.sample_rate, blocksize=self.block_size, channels=1,
+                                          dtype='float32', callback=self.callback)
+            self.stream.start()
+
+    def stop_output(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+    def stop(self):
+        self.state = OFF
+        self.level = 0.0
+        self.stop_output()
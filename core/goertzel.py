@@ -0,0 +1,105 @@
+# core/goertzel.py
+
+import numpy as np
+
+from core import NUM_HPS, MIN_FREQ, MAX_FREQ, TARGET_CENTS, TARGET_CENTS_STEP, TARGET_PERIODS, TARGET_ENERGY, \
+    TARGET_FUNDAMENTAL, TARGET_SUBHARMONIC
+from core.pitch_detector import PitchDetector, parabolic_offsets
+
+
+class GoertzelBank(PitchDetector):
+    # sliding DFT evaluated only at a few filters around the target string and its harmonics.
+    # every hop runs the new block through the bank once - a (channels, block) x (block, filters) product -
+    # and the window is the sum of the last `blocks` block partials kept in a ring, so a hop costs one block
+    # instead of a full window FFT. the harmonics are combined in the log domain like the HPS and the best
+    # filter is refined to a cents deviation from the target. one extra row of filters at half the target is
+    # only there to reject a string an octave down, whose harmonics fall on the target's.
+    domain = 'block'
+
+    def __init__(self, sample_freq, num_hps=NUM_HPS, min_freq=MIN_FREQ, max_freq=MAX_FREQ, channels=1):
+        self.sample_freq = sample_freq
+        self.num_hps = num_hps
+        self.cents_grid = np.arange(-TARGET_CENTS, TARGET_CENTS + TARGET_CENTS_STEP / 2, TARGET_CENTS_STEP)
+        self.block_size = 0
+        self.cents = np.full(channels, np.nan)  # latest deviation from the target per channel
+        super().__init__(min_freq, max_freq, channels)
+
+    def set_target(self, frequency):
+        self.target = frequency
+        # the bank is rebuilt and primed from the ring buffer on the next hop
+        self.block_size = 0
+
+    def build(self, block_size, available, target):
+        top = 2 ** (TARGET_CENTS / 1200)
+        harmonics = np.arange(1, self.num_hps + 1)
+        harmonics = np.concatenate(([0.5], harmonics[harmonics * target * top < self.sample_freq / 2]))
+        filter_freqs = harmonics[:, None] * target * 2 ** (self.cents_grid / 1200)
+        omega = 2 * np.pi * filter_freqs.ravel() / self.sample_freq
+        self.num_harmonics = len(harmonics) - 1  # the subharmonic row is not a harmonic
+
+        # exp(j w n) for n = coarse + fine from two small tables - one complex product per entry instead of
+        # a cosine and a sine, which keeps switching strings cheap
+        stride = int(np.sqrt(block_size)) + 1
+        fine = np.exp(1j * np.outer(np.arange(stride), omega))
+        coarse = np.exp(1j * np.outer(np.arange(0, block_size, stride), omega))
+        rotation = (coarse[:, None, :] * fine).reshape(-1, len(omega))[:block_size]
+        # real basis - cosine and sine halves, so the block product stays a real matrix multiplication
+        self.basis = np.empty((block_size, 2 * len(omega)), dtype=np.float32)
+        self.basis[:, :len(omega)] = rotation.real
+        self.basis[:, len(omega):] = rotation.imag
+        self.block_size = block_size
+        self.blocks = int(np.clip(round(TARGET_PERIODS * self.sample_freq / target / block_size), 1,
+                                  max(1, available // block_size)))
+        self.window_size = self.blocks * block_size
+        # a partial computed from its own block start is moved to the window start by exp(-j w offset),
+        # the i-th oldest block starts i blocks into the window
+        self.shifts = np.exp(-1j * np.outer(np.arange(self.blocks), omega) * block_size)
+        self.partials = np.zeros((self.blocks, self.channels, len(omega)), dtype=np.complex128)
+        self.newest = self.blocks - 1
+
+    def block_partials(self, blocks):
+        # DFT of each block at the bank filters: sum x[n] exp(-j w n)
+        product = blocks @ self.basis
+        half = product.shape[-1] // 2
+        return product[..., :half] - 1j * product[..., half:]
+
+    def detect(self, windows, new_frames):
+        # the target is read once - set_target may run on the Tk thread while the hop is analysed
+        target = self.target
+        if target is None:
+            self.cents[:] = np.nan
+            return np.full(len(windows), np.nan)
+        if new_frames != self.block_size:
+            # new target or block size - fill the whole ring from the buffered audio at once
+            self.build(new_frames, windows.shape[-1], target)
+            frames = windows[:, -self.window_size:].reshape(len(windows), self.blocks, new_frames)
+            self.partials[:] = self.block_partials(frames).transpose(1, 0, 2)
+            self.newest = self.blocks - 1
+        else:
+            self.newest = (self.newest + 1) % self.blocks
+            self.partials[self.newest] = self.block_partials(windows[:, -new_frames:])
+
+        # oldest to newest, so every partial gets the shift of its position in the window
+        order = (self.newest + 1 + np.arange(self.blocks)) % self.blocks
+        spectrum = np.einsum('mck,mk->ck', self.partials[order], self.shifts)
+        magnitude = np.abs(spectrum).reshape(len(windows), self.num_harmonics + 1, len(self.cents_grid))
+        subharmonic, magnitude = magnitude[:, 0], magnitude[:, 1:]
+        score = np.log(magnitude + np.finfo(np.float64).tiny).sum(axis=1)
+
+        best = np.argmax(score, axis=-1)
+        # a peak on the edge of the bank is another string or a string far out of tune
+        inside = (best > 0) & (best < len(self.cents_grid) - 1)
+        # a sinusoid holding the share p of the window energy E has |X|^2 = p * E * N / 2 - shared harmonics of
+        # another string only reach a small part of it
+        frames = windows[:, -self.window_size:]
+        energy = np.einsum('ij,ij->i', frames, frames) * self.window_size / 2
+        rows = np.arange(len(windows))
+        peaks = magnitude[rows, :, best]
+        inside &= (peaks ** 2).sum(axis=-1) >= TARGET_ENERGY * energy
+        # the harmonics of a string an octave up are all harmonics of the target too, but its fundamental is
+        # empty. a string an octave down puts its own fundamental at half the target.
+        inside &= peaks[:, 0] ** 2 >= TARGET_FUNDAMENTAL * energy
+        inside &= subharmonic[rows, best] <= TARGET_SUBHARMONIC * peaks[:, 0]
+        cents = self.cents_grid[best] + parabolic_offsets(score, best) * TARGET_CENTS_STEP
+        self.cents = np.where(inside, cents, np.nan)
+        return target * 2 ** (self.cents / 1200)
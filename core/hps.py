@@ -0,0 +1,93 @@
+# core/hps.py
+
+import numpy as np
+
+from core import NUM_HPS, MIN_FREQ, MAX_FREQ
+from core.pitch_detector import PitchDetector, parabolic_offsets
+
+
+class HarmonicProductSpectrum(PitchDetector):
+    # harmonic product spectrum evaluated only for the fundamentals between min_freq and max_freq.
+    # the peak is refined with quadratic interpolation instead of upsampling the whole spectrum.
+    # all channels are processed together, one row per channel.
+    domain = 'spectrum'
+
+    def __init__(self, delta_freq, num_bins, num_hps=NUM_HPS, min_freq=MIN_FREQ, max_freq=MAX_FREQ, channels=1):
+        self.delta_freq = delta_freq
+        self.num_bins = num_bins
+        self.num_hps = num_hps
+        super().__init__(min_freq, max_freq, channels)
+
+    def set_range(self, min_freq, max_freq):
+        self.min_freq = min_freq
+        self.max_freq = max_freq
+        first = max(1, int(min_freq / self.delta_freq))
+        last = min(int(np.ceil(max_freq / self.delta_freq)), self.num_bins - 2)
+        self.candidates = np.arange(first, max(last, first) + 1)
+
+        # bins of the harmonics 1..num_hps of every candidate, clipped to the spectrum
+        self.harmonic_bins = [np.minimum(self.candidates * h, self.num_bins - 2) for h in range(1, self.num_hps + 1)]
+        self.top = min(self.num_bins, int(self.harmonic_bins[-1][-1]) + 2)
+
+        # product spectrum of the candidate fundamentals, built harmonic by harmonic in these buffers
+        shape = (self.channels, len(self.candidates))
+        self.peak_spec = np.zeros((self.channels, self.top), dtype=np.float32)
+        self.norm = np.zeros((self.channels, 1), dtype=np.float32)
+        self.hps_spec = np.zeros(shape, dtype=np.float32)
+        self.tmp_hps_spec = np.zeros(shape, dtype=np.float32)
+        self.harmonic = np.zeros(shape, dtype=np.float32)
+        self.alive = np.zeros((self.channels, 1), dtype=bool)
+        self.active = np.zeros((self.channels, 1), dtype=bool)
+        self.silent = np.zeros(self.channels, dtype=bool)
+        self.harmonics_used = np.ones(self.channels, dtype=np.intp)
+
+    def detect(self, magnitude_spec):
+        # magnitude_spec: (channels, num_bins), returns the fundamental per channel - nan for silent channels
+        spec = magnitude_spec[:, :self.top]
+        np.max(spec, axis=-1, keepdims=True, out=self.norm)
+        silent = np.less_equal(self.norm[:, 0], 0, out=self.silent)
+        np.copyto(self.norm[:, 0], 1, where=silent)
+
+        # a harmonic of an off-bin fundamental falls between bins - take the max of each bin and its neighbours
+        np.maximum(spec[:, :-2], spec[:, 1:-1], out=self.peak_spec[:, 1:-1])
+        np.maximum(self.peak_spec[:, 1:-1], spec[:, 2:], out=self.peak_spec[:, 1:-1])
+        # normalise so the product neither underflows nor overflows
+        self.peak_spec /= self.norm
+
+        # harmonic bins are clipped to the spectrum already, mode='clip' writes into out without a temporary
+        np.take(self.peak_spec, self.harmonic_bins[0], axis=-1, out=self.hps_spec, mode='clip')
+        harmonics_used = self.harmonics_used
+        harmonics_used.fill(1)
+        self.active.fill(True)
+        for harmonic, bins in enumerate(self.harmonic_bins, start=1):
+            np.take(self.peak_spec, bins, axis=-1, out=self.harmonic, mode='clip')
+            np.multiply(self.hps_spec, self.harmonic, out=self.tmp_hps_spec)
+            # a channel stops at the first harmonic that wipes out its whole product
+            np.any(self.tmp_hps_spec, axis=-1, keepdims=True, out=self.alive)
+            self.active &= self.alive
+            if not self.active.any():
+                break
+            np.copyto(self.tmp_hps_spec, self.hps_spec, where=~self.active)
+            self.hps_spec, self.tmp_hps_spec = self.tmp_hps_spec, self.hps_spec
+            harmonics_used[self.active[:, 0]] = harmonic
+        fundamental_bin = self.candidates[np.argmax(self.hps_spec, axis=-1)]
+
+        # refine on the strongest harmonic - its peak position divided by the harmonic number
+        # gives the fundamental with sub-bin accuracy
+        rows = np.arange(self.channels)
+        best_bin = fundamental_bin.copy()
+        best_harmonic = np.ones(self.channels, dtype=np.intp)
+        for harmonic in range(1, int(harmonics_used.max()) + 1):
+            radius = (harmonic + 1) // 2
+            centre = fundamental_bin * harmonic
+            valid = (harmonic <= harmonics_used) & (centre + radius < spec.shape[-1])
+            centre = np.minimum(centre, spec.shape[-1] - radius - 1)
+            neighbourhood = centre[:, None] + np.arange(-radius, radius + 1)
+            peak_bin = centre - radius + np.argmax(np.take_along_axis(spec, neighbourhood, axis=-1), axis=-1)
+            better = valid & (spec[rows, peak_bin] > spec[rows, best_bin])
+            best_bin = np.where(better, peak_bin, best_bin)
+            best_harmonic = np.where(better, harmonic, best_harmonic)
+
+        freqs = (best_bin + parabolic_offsets(spec, best_bin, log=True)) * self.delta_freq / best_harmonic
+        freqs[silent] = np.nan
+        return freqs
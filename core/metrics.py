@@ -0,0 +1,161 @@
+# core/metrics.py
+
+import heapq
+import json
+import threading
+from time import perf_counter
+
+import numpy as np
+
+from core import LATENCY_HISTORY
+
+STAGES = ['buffering', 'windowing', 'fft', 'noise_gate', 'detector', 'note_lookup', 'gui_dispatch']
+
+
+class EngineMetrics:
+    # per-stage timers and stream health counters of a TunerEngine.
+    # hops are timed with lap() between stages, which costs one perf_counter call per stage.
+    def __init__(self, block_budget, slowest_hops=0):
+        self.block_budget = block_budget  # seconds of audio in one callback block
+        self.slowest_hops = slowest_hops  # > 0 keeps the stage breakdown of the slowest hops
+        self.hop_stages = dict.fromkeys(STAGES, 0.0)  # breakdown of the hop being analysed
+        self.hop_start = 0.0
+        self.reset()
+
+    def reset(self):
+        self.stage_total = dict.fromkeys(STAGES, 0.0)
+        self.stage_max = dict.fromkeys(STAGES, 0.0)
+        self.hops = 0
+        self.hop_total = 0.0
+        self.hop_max = 0.0
+        self.callbacks = 0
+        self.callback_total = 0.0
+        self.callback_max = 0.0
+        self.callbacks_over_budget = 0
+        self.input_overflows = 0
+        self.input_underflows = 0
+        self.power_rejections = 0
+        self.slowest = []  # min-heap of (duration, hop, breakdown)
+
+    def start_hop(self):
+        for stage in STAGES:
+            self.hop_stages[stage] = 0.0
+        self.hop_start = perf_counter()
+        return self.hop_start
+
+    def lap(self, stage, start):
+        now = perf_counter()
+        self.hop_stages[stage] += now - start
+        return now
+
+    def end_hop(self):
+        duration = perf_counter() - self.hop_start
+        self.hops += 1
+        self.hop_total += duration
+        self.hop_max = max(self.hop_max, duration)
+        for stage, elapsed in self.hop_stages.items():
+            self.stage_total[stage] += elapsed
+            if elapsed > self.stage_max[stage]:
+                self.stage_max[stage] = elapsed
+        if self.slowest_hops and (len(self.slowest) < self.slowest_hops or duration > self.slowest[0][0]):
+            entry = (duration, self.hops, dict(self.hop_stages))
+            if len(self.slowest) < self.slowest_hops:
+                heapq.heappush(self.slowest, entry)
+            else:
+                heapq.heapreplace(self.slowest, entry)
+
+    def record_callback(self, duration, frames, status, sample_freq):
+        self.callbacks += 1
+        self.callback_total += duration
+        self.callback_max = max(self.callback_max, duration)
+        budget = frames / sample_freq if frames else self.block_budget
+        if duration > budget:
+            self.callbacks_over_budget += 1
+        if status:
+            self.input_overflows += bool(getattr(status, 'input_overflow', False))
+            self.input_underflows += bool(getattr(status, 'input_underflow', False))
+
+    def snapshot(self, dropped_blocks=0):
+        def ms(seconds):
+            return round(seconds * 1000, 4)
+
+        hops = max(self.hops, 1)
+        callbacks = max(self.callbacks, 1)
+        return {
+            'hops': self.hops,
+            'hop_mean_ms': ms(self.hop_total / hops),
+            'hop_max_ms': ms(self.hop_max),
+            'stages': {stage: {'mean_ms': ms(self.stage_total[stage] / hops), 'max_ms': ms(self.stage_max[stage])}
+                       for stage in STAGES},
+            'callbacks': self.callbacks,
+            'callback_mean_ms': ms(self.callback_total / callbacks),
+            'callback_max_ms': ms(self.callback_max),
+            'block_budget_ms': ms(self.block_budget),
+            'callbacks_over_budget': self.callbacks_over_budget,
+            'input_overflows': self.input_overflows,
+            'input_underflows': self.input_underflows,
+            'dropped_blocks': dropped_blocks,
+            'power_rejections': self.power_rejections,
+            'slowest_hops': [{'hop': hop, 'duration_ms': ms(duration),
+                              'stages': {stage: ms(elapsed) for stage, elapsed in stages.items()}}
+                             for duration, hop, stages in sorted(self.slowest, reverse=True)],
+        }
+
+
+class SessionLatency:
+    # latency of one server session - from receiving an audio chunk to sending its readings back.
+    # the latest `history` chunks are kept in a ring for the percentiles.
+    def __init__(self, sample_freq, history=LATENCY_HISTORY):
+        self.sample_freq = sample_freq
+        self.latencies = np.zeros(history)
+        self.chunks = 0
+        self.frames = 0
+        self.busy = 0.0  # seconds spent on the chunks
+        self.latency_max = 0.0
+
+    def record(self, latency, frames):
+        self.latencies[self.chunks % len(self.latencies)] = latency
+        self.chunks += 1
+        self.frames += frames
+        self.busy += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def snapshot(self):
+        def ms(seconds):
+            return round(float(seconds) * 1000, 4)
+
+        recent = self.latencies[:min(self.chunks, len(self.latencies))]
+        p50, p95 = np.percentile(recent, [50, 95]) if len(recent) else (0.0, 0.0)
+        return {
+            'chunks': self.chunks,
+            'audio_seconds': round(self.frames / self.sample_freq, 3),
+            'latency_p50_ms': ms(p50),
+            'latency_p95_ms': ms(p95),
+            'latency_max_ms': ms(self.latency_max),
+            'realtime_factor': round(self.frames / self.sample_freq / self.busy, 1) if self.busy else None,
+        }
+
+
+class MetricsReporter(threading.Thread):
+    # writes a metrics snapshot of the engine to a json file every `interval` seconds while the stream runs
+    def __init__(self, engine, path, interval):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.engine.dump_metrics(self.path)
+        self.engine.dump_metrics(self.path)
+
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+
+def write_snapshot(snapshot, path):
+    with open(path, "w") as file:
+        json.dump(snapshot, file, indent=2)
@@ -0,0 +1,50 @@
+# core/noise_gate.py
+
+import numpy as np
+
+from core import OCTAVE_BANDS, WHITE_NOISE_THRESH
+
+
+class NoiseGate:
+    # white noise suppression per frequency band.
+    # band boundaries and the bin -> band mapping are built once from delta_freq, so every hop
+    # needs a single reduction for the band rms and a single masked write over all channels.
+    def __init__(self, delta_freq, num_bins, bands=OCTAVE_BANDS, thresh=WHITE_NOISE_THRESH, low_cut=16, channels=1):
+        self.thresh = thresh
+        self.bands = bands
+        self.low_cut_idx = min(int(low_cut / delta_freq), num_bins)  # everything under low_cut Hz is cut off
+
+        edges = [min(int(band / delta_freq), num_bins) for band in bands]
+        starts = [start for start, end in zip(edges[:-1], edges[1:]) if end > start]
+        counts = [end - start for start, end in zip(edges[:-1], edges[1:]) if end > start]
+        self.start = starts[0] if starts else 0
+        self.end = starts[-1] + counts[-1] if starts else 0
+        self.offsets = np.array(starts, dtype=np.intp) - self.start
+        self.counts = np.array(counts, dtype=np.float32)
+        self.bin_band = np.repeat(np.arange(len(counts)), counts)
+
+        # band energies and thresholds of the gated bins - a mixed float64 operand would upcast into temporaries
+        self.energy = np.zeros((channels, self.end - self.start), dtype=np.float32)
+        self.band_thresh = np.zeros((channels, len(counts)), dtype=np.float32)
+        self.bin_thresh = np.zeros((channels, self.end - self.start), dtype=np.float32)
+        self.mask = np.zeros((channels, self.end - self.start), dtype=bool)
+
+    def apply(self, magnitude_spec):
+        # magnitude_spec: (channels, num_bins), gated in place
+        magnitude_spec[:, :self.low_cut_idx] = 0
+        if not len(self.counts):
+            return magnitude_spec
+
+        segment = magnitude_spec[:, self.start:self.end]
+        np.square(segment, out=self.energy)
+        np.add.reduceat(self.energy, self.offsets, axis=-1, out=self.band_thresh)
+        # rms per band, scaled by the threshold factor
+        self.band_thresh /= self.counts
+        np.sqrt(self.band_thresh, out=self.band_thresh)
+        self.band_thresh *= self.thresh
+
+        # mode='raise' would buffer the output, the band indices are in range by construction
+        np.take(self.band_thresh, self.bin_band, axis=-1, out=self.bin_thresh, mode='clip')
+        np.less_equal(segment, self.bin_thresh, out=self.mask)
+        np.copyto(segment, 0, where=self.mask)
+        return magnitude_spec
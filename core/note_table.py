@@ -0,0 +1,61 @@
+# core/note_table.py
+
+import numpy as np
+
+from core import CONCERT_PITCH, ALL_NOTES, TEMPERAMENT
+
+# cents of each pitch class above C, in ALL_NOTES order (A, A#, ..., G#). tempered scales are tuned in C.
+TEMPERAMENTS = {
+    'equal': [900, 1000, 1100, 0, 100, 200, 300, 400, 500, 600, 700, 800],
+    'just': [884.36, 1017.6, 1088.27, 0, 111.73, 203.91, 315.64, 386.31, 498.04, 590.22, 701.96, 813.69],
+    'pythagorean': [905.87, 996.09, 1109.78, 0, 113.69, 203.91, 294.13, 407.82, 498.04, 611.73, 701.96, 815.64],
+    'werckmeister3': [888.27, 996.09, 1092.18, 0, 90.22, 192.18, 294.13, 390.22, 498.04, 588.27, 696.09, 792.18],
+}
+LOWEST_NOTE = -57  # C0 in semitones from a4
+HIGHEST_NOTE = 50  # B8
+
+
+class NoteTable:
+    # every note between C0 and B8 compiled once for a reference pitch and temperament.
+    # frequencies are mapped with a binary search over the log2 midpoints between neighbouring notes,
+    # so a whole array of channel readings is resolved in one vectorized call.
+    def __init__(self, reference=CONCERT_PITCH, temperament=TEMPERAMENT):
+        self.reference = reference
+        self.temperament = temperament
+        steps = np.arange(LOWEST_NOTE, HIGHEST_NOTE + 1)
+        classes = steps % 12
+        # deviation of every pitch class from equal temperament, the reference a stays where it is
+        offsets = np.asarray(TEMPERAMENTS[temperament], dtype=float) - TEMPERAMENTS['equal']
+        offsets -= offsets[0]
+        self.names = np.array([ALL_NOTES[i % 12] + str(4 + (i + 9) // 12) for i in steps])
+        self.pitches = reference * 2 ** ((100 * steps + offsets[classes]) / 1200)
+        self.log_pitches = np.log2(self.pitches)
+        self.boundaries = (self.log_pitches[1:] + self.log_pitches[:-1]) / 2
+        self.string_names = np.array([], dtype=self.names.dtype)
+        self.string_pitches = np.array([])
+        self.string_boundaries = np.array([])
+
+    def lookup(self, freqs):
+        # freqs: scalar or array in Hz -> (note indices, note pitches, cents from the note)
+        log_freqs = np.log2(freqs)
+        idx = np.searchsorted(self.boundaries, log_freqs)
+        return idx, self.pitches[idx], 1200 * (log_freqs - self.log_pitches[idx])
+
+    def closest_note(self, freq):
+        idx = int(np.searchsorted(self.boundaries, np.log2(freq)))
+        return str(self.names[idx]), float(self.pitches[idx])
+
+    def set_strings(self, strings):
+        # strings: {name: frequency} of the active tuning, sorted by pitch for the binary search
+        ordered = sorted(strings.items(), key=lambda item: item[1])
+        self.string_names = np.array([name for name, _ in ordered])
+        self.string_pitches = np.array([freq for _, freq in ordered], dtype=float)
+        log_strings = np.log2(self.string_pitches)
+        self.string_boundaries = (log_strings[1:] + log_strings[:-1]) / 2
+
+    def nearest_string(self, freqs):
+        # freqs: scalar or array in Hz -> (string indices, string pitches, cents from the string)
+        log_freqs = np.log2(freqs)
+        idx = np.searchsorted(self.string_boundaries, log_freqs)
+        pitches = self.string_pitches[idx]
+        return idx, pitches, 1200 * (log_freqs - np.log2(pitches))
@@ -0,0 +1,56 @@
+# core/phase_vocoder.py
+
+import numpy as np
+
+from core import NUM_HPS
+
+
+class PhaseVocoder:
+    # instantaneous frequency from the phase advance of the peak bin between two consecutive hops.
+    # a sinusoid at f advances its phase by 2 pi f hop / fs between frames that start `hop` samples apart,
+    # so the advance beyond the bin centre gives f to a fraction of a bin - unambiguous for a deviation
+    # up to fs / (2 hop), which covers the half bin a coarse peak can be off while hop <= window_size.
+    def __init__(self, window_size, sample_freq, num_harmonics=NUM_HPS, channels=1):
+        self.window_size = window_size
+        self.sample_freq = sample_freq
+        self.bin_freq = sample_freq / window_size
+        self.harmonics = np.arange(1, num_harmonics + 1)
+        self.previous = np.zeros((channels, window_size // 2 + 1), dtype=np.complex128)
+        self.has_previous = False
+        # phase advance of the refined partial in cycles per hop - the raw data for a strobe display
+        self.advance = np.full(channels, np.nan)
+
+    def reset(self):
+        # the next frame does not follow the stored one, e.g. after a dropped or silent hop
+        self.has_previous = False
+
+    def refine(self, spectrum, magnitude, freqs, hop):
+        # spectrum/magnitude: (channels, bins) of this hop, freqs: coarse fundamentals, nan where none.
+        # returns the refined fundamentals and keeps this spectrum for the next hop.
+        refined = freqs
+        if self.has_previous and 0 < hop <= self.window_size:
+            refined = self.instantaneous(spectrum, magnitude, freqs, hop)
+        np.copyto(self.previous, spectrum)
+        self.has_previous = True
+        return refined
+
+    def instantaneous(self, spectrum, magnitude, freqs, hop):
+        rows = np.arange(len(freqs))
+        found = ~np.isnan(freqs)
+        # the strongest harmonic has the cleanest phase, its deviation is divided back by the harmonic number
+        bins = np.rint(np.where(found, freqs, 0)[:, None] * self.harmonics / self.bin_freq).astype(int)
+        valid = (bins > 0) & (bins < magnitude.shape[-1] - 1)
+        bins = np.where(valid, bins, 0)
+        strongest = np.argmax(np.where(valid, magnitude[rows[:, None], bins], -1), axis=-1)
+        peak = bins[rows, strongest]
+        harmonic = self.harmonics[strongest]
+
+        advance = np.angle(spectrum[rows, peak] * np.conj(self.previous[rows, peak]))
+        expected = 2 * np.pi * peak * hop / self.window_size
+        deviation = np.mod(advance - expected + np.pi, 2 * np.pi) - np.pi
+        partial = peak * self.bin_freq + deviation * self.sample_freq / (2 * np.pi * hop)
+        self.advance = partial * hop / self.sample_freq
+
+        # more than a bin away from the coarse peak means the note changed between the hops
+        stable = found & valid[rows, strongest] & (np.abs(partial - harmonic * freqs) <= self.bin_freq)
+        return np.where(stable, partial / harmonic, freqs)
@@ -0,0 +1,52 @@
+# core/pitch_detector.py
+
+import numpy as np
+
+from core import MIN_FREQ, MAX_FREQ
+
+
+def parabolic_offsets(values, idx, log=False):
+    # vertex of the parabola through values[idx - 1], values[idx], values[idx + 1] for every row,
+    # returned as a fractional offset from idx. with log the parabola goes through the log of positive values -
+    # the log magnitude of a hann windowed spectral peak is close to a parabola, which keeps the error well
+    # under a cent.
+    idx = np.clip(idx, 1, values.shape[-1] - 2)
+    rows = np.arange(len(values))
+    left, centre, right = values[rows, idx - 1], values[rows, idx], values[rows, idx + 1]
+    if log:
+        positive = (left > 0) & (centre > 0) & (right > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            left = np.where(positive, np.log(left), left)
+            centre = np.where(positive, np.log(centre), centre)
+            right = np.where(positive, np.log(right), right)
+    denom = left - 2 * centre + right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(denom != 0, 0.5 * (left - right) / denom, 0.0)
+    return np.clip(offset, -0.5, 0.5)
+
+
+class PitchDetector:
+    # common interface of the pitch detectors used by TunerEngine.
+    # 'spectrum' detectors get the noise gated magnitude spectrum of the full engine window,
+    # 'time' detectors get the raw (channels, samples) windows of the shared ring buffer and only
+    # look at the newest `window_size` samples they need.
+    # 'block' detectors get the same windows plus the number of new samples and update themselves per hop.
+    domain = 'time'
+    window_size = 0
+    target = None
+
+    def __init__(self, min_freq=MIN_FREQ, max_freq=MAX_FREQ, channels=1):
+        self.channels = channels
+        self.set_range(min_freq, max_freq)
+
+    def set_range(self, min_freq, max_freq):
+        self.min_freq = min_freq
+        self.max_freq = max_freq
+
+    def set_target(self, frequency):
+        # frequency of the string being tuned, None in chromatic mode - only targeted detectors keep it
+        pass
+
+    def detect(self, data):
+        # returns the fundamental frequency per channel, nan where nothing was found
+        raise NotImplementedError
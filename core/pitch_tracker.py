@@ -0,0 +1,98 @@
+# core/pitch_tracker.py
+
+import numpy as np
+
+from core import TRACKER_HISTORY, TRACKER_OUTLIER_CENTS, TRACKER_ONSET_HOPS, TRACKER_HOLD_HOPS, TRACKER_SETTLE_HOPS, \
+    TRACKER_NOISE_CENTS, TRACKER_DRIFT_CENTS
+
+MAD_SIGMA = 1.4826  # median absolute deviation -> standard deviation of normally distributed readings
+
+
+def row_medians(values, counts):
+    # median of the first counts[i] values of every sorted row, nan rows first sorted to the end
+    rows = np.arange(len(values))
+    last = np.maximum(counts - 1, 0)
+    return (values[rows, last // 2] + values[rows, (last + 1) // 2]) / 2
+
+
+class PitchTracker:
+    # smooths the per hop readings of every channel over time. readings are tracked in cents from the reference,
+    # the accepted ones of each channel are kept in a ring. a reading far from their median is an outlier - unless
+    # the next ones agree with it, then the string changed and the track restarts there (an onset). accepted
+    # readings go through a one state kalman filter whose measurement noise follows the spread of the ring, so a
+    # clean string settles within a few hops while a wobbly one is averaged harder.
+    def __init__(self, channels=1, history=TRACKER_HISTORY, outlier_cents=TRACKER_OUTLIER_CENTS,
+                 onset_hops=TRACKER_ONSET_HOPS, hold_hops=TRACKER_HOLD_HOPS):
+        self.outlier_cents = outlier_cents
+        self.onset_hops = onset_hops
+        self.hold_hops = hold_hops
+        self.rows = np.arange(channels)
+        self.history = np.full((channels, history), np.nan)  # accepted readings in cents, a ring per channel
+        self.sorted = np.full((channels, history), np.nan)
+        self.positions = np.zeros(channels, dtype=np.intp)
+        self.counts = np.zeros(channels, dtype=np.intp)
+        self.estimate = np.full(channels, np.nan)  # filtered cents, nan while nothing is tracked
+        self.variance = np.zeros(channels)
+        self.candidate = np.full(channels, np.nan)  # latest outlier, the possible start of a new note
+        self.candidates = np.zeros(channels, dtype=np.intp)  # consecutive outliers agreeing with each other
+        self.missing = np.zeros(channels, dtype=np.intp)  # hops since the last reading
+        self.spread = np.zeros(channels)  # median absolute deviation of the ring in cents
+        self.confidence = np.zeros(channels)
+        self.onset = np.zeros(channels, dtype=bool)  # a new note started with the last update
+
+    def reset(self, channels=None):
+        channels = self.rows if channels is None else channels
+        self.history[channels] = np.nan
+        self.positions[channels] = 0
+        self.counts[channels] = 0
+        self.estimate[channels] = np.nan
+        self.candidates[channels] = 0
+        self.confidence[channels] = 0
+
+    def miss(self):
+        # a hop without any reading, e.g. silence
+        return self.update(np.full(len(self.rows), np.nan))
+
+    def update(self, cents):
+        # cents: (channels,) readings of this hop, nan where nothing was found. returns the filtered cents
+        found = ~np.isnan(cents)
+        self.missing = np.where(found, 0, self.missing + 1)
+        self.reset(self.missing >= self.hold_hops)
+        tracking = self.counts > 0
+
+        median = self.median()
+        with np.errstate(invalid='ignore'):
+            outlier = found & tracking & (np.abs(cents - median) > self.outlier_cents)
+            agree = np.abs(cents - self.candidate) <= self.outlier_cents / 2
+        self.candidates = np.where(outlier, np.where(agree, self.candidates + 1, 1), 0)
+        self.candidate = np.where(outlier, cents, np.nan)
+        onset = found & (~tracking | (self.candidates >= self.onset_hops))
+        self.reset(onset)
+        self.onset = onset
+
+        accept = found & ~outlier | onset
+        slots = self.positions[accept]
+        self.history[self.rows[accept], slots] = cents[accept]
+        self.positions[accept] = (slots + 1) % self.history.shape[-1]
+        self.counts[accept] = np.minimum(self.counts[accept] + 1, self.history.shape[-1])
+
+        median = self.median()
+        np.abs(np.subtract(self.history, median[:, None], out=self.sorted), out=self.sorted)
+        self.sorted.sort(axis=-1)
+        self.spread = np.where(self.counts > 0, row_medians(self.sorted, self.counts), 0)
+        noise = np.maximum(TRACKER_NOISE_CENTS, MAD_SIGMA * self.spread) ** 2
+        predicted = self.variance + TRACKER_DRIFT_CENTS ** 2
+        gain = predicted / (predicted + noise)
+        filtered = accept & ~onset
+        self.estimate = np.where(onset, cents, np.where(filtered, self.estimate + gain * (cents - self.estimate),
+                                                        self.estimate))
+        self.variance = np.where(onset, noise, np.where(filtered, (1 - gain) * predicted, self.variance))
+
+        settled = np.minimum(self.counts / TRACKER_SETTLE_HOPS, 1)
+        self.confidence = settled * np.clip(1 - self.spread / self.outlier_cents, 0, 1)
+        return self.estimate
+
+    def median(self):
+        np.copyto(self.sorted, self.history)
+        self.sorted.sort(axis=-1)
+        return row_medians(self.sorted, self.counts)
@@ -0,0 +1,216 @@
+# core/recorder.py
+# session recordings of the tuner - the analysed input blocks with their callback timestamps, the readings of every
+# hop and the settings they were made with. a session is a directory of raw little endian files, all of them can be
+# opened with np.memmap:
+#   session.json       sample rate, channels, engine parameters, settings changes and the record layouts below
+#   audio-00000.f32    (frames, channels) float32 input, RECORD_CHUNK_SECONDS of audio per chunk file
+#   blocks.bin         one BLOCK record per analysed callback block
+#   results.bin        one RESULT record per channel of every analysed hop
+
+import json
+import os
+import time
+from time import perf_counter
+
+import numpy as np
+
+from core import RECORD_CHUNK_SECONDS
+from core.audio_sources import AudioSource
+
+FORMAT_VERSION = 1
+AUDIO_DTYPE = np.dtype('<f4')
+# frame: frames recorded before the block, received/analysed: perf_counter seconds since the recording started,
+# adc_time: stream clock of the callback (nan without one), status: overflow (1) and underflow (2) flags,
+# dropped: blocks the hop queue dropped so far - the input between two recorded blocks is missing when it grows
+BLOCK = np.dtype([('frame', '<i8'), ('frames', '<u4'), ('received', '<f8'), ('analysed', '<f8'),
+                  ('adc_time', '<f8'), ('status', 'u1'), ('dropped', '<u4')])
+# engine state after a hop: frames recorded up to the hop, note name ('' without a reading), detector output,
+# tracked frequency, cents from the note, tracker confidence and seconds from the callback to the reading
+RESULT = np.dtype([('frame', '<i8'), ('channel', '<u2'), ('note', 'S4'), ('detected', '<f4'), ('freq', '<f4'),
+                   ('cents', '<f4'), ('confidence', '<f4'), ('latency', '<f4')])
+
+
+def fill_results(rows, engine, frame, latency):
+    # rows: (channels,) RESULT array, filled in place with the latest hop of the engine
+    rows['frame'] = frame
+    rows['channel'] = np.arange(len(rows))
+    rows['detected'] = engine.detected_freqs
+    rows['freq'] = engine.tracked_freqs
+    rows['cents'] = engine.detected_cents
+    rows['confidence'] = engine.tracker.confidence
+    rows['latency'] = latency
+    for channel, result in enumerate(engine.channel_results):
+        rows['note'][channel] = result[0].encode() if result else b''
+    return rows
+
+
+def load_records(path, dtype):
+    # memory maps a record file, np.memmap refuses empty files
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+class SessionRecorder:
+    # records a running stream from the analysis side: process_hop hands over every block it analyses, so the
+    # recording holds exactly the audio the readings came from, also when the hop queue dropped blocks in between.
+    # the writes go through large file buffers, a block costs a copy and the audio callback never touches the disk.
+    def __init__(self, engine, directory, chunk_seconds=RECORD_CHUNK_SECONDS):
+        self.engine = engine
+        self.path = os.path.join(directory, time.strftime('%Y%m%d-%H%M%S'))
+        suffix = 1
+        while os.path.exists(self.path):
+            suffix += 1
+            self.path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{suffix}")
+        os.makedirs(self.path)
+        self.chunk_frames = max(1, int(chunk_seconds * engine.sample_freq))
+        self.start = perf_counter()
+        self.frames = 0
+        self.chunks = 0
+        self.chunk_file = None
+        self.chunk_left = 0  # frames until the current chunk is full
+        self.blocks_file = open(os.path.join(self.path, 'blocks.bin'), 'wb', buffering=2 ** 16)
+        self.results_file = open(os.path.join(self.path, 'results.bin'), 'wb', buffering=2 ** 16)
+        self.block = np.zeros(1, dtype=BLOCK)
+        self.rows = np.zeros(engine.channels, dtype=RESULT)
+        self.received = 0.0  # callback time of the last block, the latency of a reading is measured from it
+        self.hops = engine.analysed_hops
+        self.settings = []  # settings changes as {'frame': ..., **engine.settings()}
+        self.current_settings = None
+        self.write_info()
+        print(f"Recording to {self.path}")
+
+    def info(self):
+        engine = self.engine
+        return {
+            'version': FORMAT_VERSION,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'sample_freq': engine.sample_freq,
+            'channels': engine.channels,
+            'engine': {
+                'window_size': engine.window_size,
+                'window_step': engine.window_step,
+                'block_size': engine.block_size,
+                'num_hps': engine.num_hps,
+                'power_thresh': engine.power_thresh,
+                'white_noise_thresh': engine.white_noise_thresh,
+            },
+            'chunk_frames': self.chunk_frames,
+            'chunks': self.chunks,
+            'frames': self.frames,
+            'audio_dtype': AUDIO_DTYPE.str,
+            'block_dtype': np.lib.format.dtype_to_descr(BLOCK),
+            'result_dtype': np.lib.format.dtype_to_descr(RESULT),
+            'settings': self.settings,
+        }
+
+    def write_info(self):
+        with open(os.path.join(self.path, 'session.json'), 'w') as file:
+            json.dump(self.info(), file, indent=2)
+
+    def record_block(self, samples):
+        # called by process_hop before the block is analysed
+        engine = self.engine
+        settings = engine.settings()
+        if settings != self.current_settings:
+            self.current_settings = settings
+            self.settings.append({'frame': self.frames, **settings})
+        queue = engine.hop_queue
+        stamp = queue.stamps[queue.current] if queue.current is not None else None
+        block = self.block[0]
+        block['frame'] = self.frames
+        block['frames'] = len(samples)
+        block['analysed'] = perf_counter() - self.start
+        if stamp is not None:
+            self.received = stamp['received']
+            block['received'] = stamp['received'] - self.start
+            block['adc_time'] = stamp['adc_time']
+            block['status'] = stamp['status']
+        else:
+            self.received = perf_counter()
+            block['received'] = block['analysed']
+            block['adc_time'] = np.nan
+            block['status'] = 0
+        block['dropped'] = queue.dropped_blocks
+        self.blocks_file.write(self.block)
+        self.write_audio(np.ascontiguousarray(samples.reshape(len(samples), -1), dtype=AUDIO_DTYPE))
+
+    def write_audio(self, samples):
+        while len(samples):
+            if not self.chunk_left:
+                self.next_chunk()
+            count = min(len(samples), self.chunk_left)
+            self.chunk_file.write(samples[:count])
+            self.chunk_left -= count
+            self.frames += count
+            samples = samples[count:]
+
+    def next_chunk(self):
+        if self.chunk_file:
+            self.chunk_file.close()
+        self.chunk_file = open(os.path.join(self.path, f'audio-{self.chunks:05d}.f32'), 'wb', buffering=2 ** 20)
+        self.chunks += 1
+        self.chunk_left = self.chunk_frames
+
+    def record_results(self):
+        # called by process_hop after the block - a row per channel once a hop was analysed
+        engine = self.engine
+        if engine.analysed_hops == self.hops:
+            return
+        self.hops = engine.analysed_hops
+        self.results_file.write(fill_results(self.rows, engine, self.frames, perf_counter() - self.received))
+
+    def close(self):
+        for file in (self.chunk_file, self.blocks_file, self.results_file):
+            if file:
+                file.close()
+        self.write_info()
+        print(f"Recorded {self.frames / self.engine.sample_freq:.1f}s to {self.path}")
+
+
+class Recording:
+    # a recorded session opened for reading, the audio chunks and records are memory mapped
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'session.json'), 'r') as file:
+            self.info = json.load(file)
+        if self.info.get('version') != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported recording version {self.info.get('version')}")
+        self.sample_freq = self.info['sample_freq']
+        self.channels = self.info['channels']
+        self.chunk_frames = self.info['chunk_frames']
+        self.settings = self.info['settings']
+        self.blocks = load_records(os.path.join(path, 'blocks.bin'), BLOCK)
+        self.results = load_records(os.path.join(path, 'results.bin'), RESULT)
+        self.chunks = [load_records(os.path.join(path, f'audio-{chunk:05d}.f32'), AUDIO_DTYPE)
+                       .reshape(-1, self.channels) for chunk in range(self.info['chunks'])]
+        self.frames = sum(len(chunk) for chunk in self.chunks)
+        longest = int(self.blocks['frames'].max()) if len(self.blocks) else 0
+        self.buffer = np.zeros((longest, self.channels), dtype=np.float32)
+
+    def audio(self, start, frames):
+        # (frames, channels) from frame `start` on - a view into the chunk, a copy only where a block spans two
+        chunk, offset = divmod(start, self.chunk_frames)
+        if offset + frames <= self.chunk_frames:
+            return self.chunks[chunk][offset:offset + frames]
+        out = self.buffer[:frames]
+        head = self.chunk_frames - offset
+        out[:head] = self.chunks[chunk][offset:]
+        out[head:] = self.chunks[chunk + 1][:frames - head]
+        return out
+
+    def block_audio(self, index):
+        block = self.blocks[index]
+        return self.audio(int(block['frame']), int(block['frames']))
+
+
+class RecordingSource(AudioSource):
+    # plays the blocks of a recording back as they were analysed, block sizes included, so every hop of the
+    # replay covers the same audio as the recorded one
+    def __init__(self, recording, speed=None):
+        super().__init__(recording.sample_freq, recording.channels, int(recording.buffer.shape[0]), speed)
+        self.recording = recording
+
+    def blocks(self):
+        for index in range(len(self.recording.blocks)):
+            yield self.recording.block_audio(index)
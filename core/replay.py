@@ -0,0 +1,150 @@
+# core/replay.py
+# replays a recorded session (see RECORD_DIR) through the current engine and compares the readings bit for bit:
+#   python -m core.replay sessions/20261018-101500 --json replay.json
+#   python -m core.replay sessions/20261018-101500 --save before.bin   (then after a change)
+#   python -m core.replay sessions/20261018-101500 --baseline before.bin
+
+import argparse
+import json
+from time import perf_counter
+
+import numpy as np
+
+from core.chromatuna_engine import TunerEngine
+from core.recorder import RESULT, Recording, RecordingSource, fill_results, load_records
+
+
+class SessionReplay:
+    # takes the place of the engine's recorder while a recording is played back. before each block the settings
+    # recorded for it are applied, and a block the live hop queue dropped breaks the continuity again, so every hop
+    # is analysed the way it was live. the readings of every analysed hop are kept in memory.
+    def __init__(self, engine, recording):
+        self.engine = engine
+        self.recording = recording
+        self.frames = 0
+        self.block = 0
+        self.dropped_blocks = 0
+        self.next_settings = 0
+        self.received = 0.0
+        self.hops = engine.analysed_hops
+        self.rows = np.zeros(engine.channels, dtype=RESULT)
+        self.readings = []
+
+    def record_block(self, samples):
+        settings = self.recording.settings
+        while self.next_settings < len(settings) and settings[self.next_settings]['frame'] <= self.frames:
+            self.engine.apply_settings(settings[self.next_settings])
+            self.next_settings += 1
+        dropped = self.recording.blocks[self.block]['dropped']
+        if dropped != self.dropped_blocks:
+            self.dropped_blocks = dropped
+            self.engine.break_continuity()
+        queue = self.engine.hop_queue
+        self.received = queue.stamps[queue.current]['received'] if queue.current is not None else perf_counter()
+        self.block += 1
+        self.frames += len(samples)
+
+    def record_results(self):
+        engine = self.engine
+        if engine.analysed_hops == self.hops:
+            return
+        self.hops = engine.analysed_hops
+        self.readings.append(fill_results(self.rows, engine, self.frames, perf_counter() - self.received).copy())
+
+    def results(self):
+        return np.concatenate(self.readings) if self.readings else np.zeros(0, dtype=RESULT)
+
+    def close(self):
+        pass
+
+
+def replay(recording, speed=None):
+    # runs the recording through a new engine built like the recorded one, as fast as possible or `speed` times
+    # real time. returns the readings, the engine metrics and the seconds the replay took
+    params = recording.info['engine']
+    engine = TunerEngine(recording.sample_freq, params['window_size'], params['window_step'], params['num_hps'],
+                         params['power_thresh'], params['white_noise_thresh'], None, recording.channels,
+                         params['block_size'])
+    engine.verbose = False
+    engine.metrics_path = None
+    engine.record_dir = None
+    session = engine.recorder = SessionReplay(engine, recording)
+    start = perf_counter()
+    engine.start_stream(RecordingSource(recording, speed))
+    engine.wait()
+    return session.results(), engine.metrics_snapshot(), perf_counter() - start
+
+
+def compare(expected, actual, sample_freq):
+    # readings are compared bit for bit, nan equal to nan - only the latency may differ
+    rows = min(len(expected), len(actual))
+    expected, actual = expected[:rows], actual[:rows]
+    differ = np.zeros(rows, dtype=bool)
+    for field in RESULT.names:
+        if field == 'latency':
+            continue
+        a, b = expected[field], actual[field]
+        if a.dtype.kind == 'f':
+            differ |= (a != b) & ~(np.isnan(a) & np.isnan(b))
+        else:
+            differ |= a != b
+    with np.errstate(invalid='ignore'):
+        cents = np.abs(expected['cents'] - actual['cents'])
+    first = np.flatnonzero(differ)
+    return {
+        'rows_differ': int(differ.sum()),
+        'rows_missing': abs(len(expected) - len(actual)) if len(expected) != len(actual) else 0,
+        'first_difference_s': round(int(expected['frame'][first[0]]) / sample_freq, 3) if len(first) else None,
+        'max_cents_difference': float(np.nanmax(cents)) if rows and not np.isnan(cents).all() else 0.0,
+    }
+
+
+def latency_ms(results):
+    if not len(results):
+        return {'p50': None, 'p95': None}
+    p50, p95 = np.percentile(results['latency'], [50, 95]) * 1000
+    return {'p50': round(float(p50), 4), 'p95': round(float(p95), 4)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m core.replay', description="Replay a recorded tuner session")
+    parser.add_argument('recording', help="session directory written by the recorder")
+    parser.add_argument('--speed', type=float,
+                        help="play at this multiple of real time, as fast as possible if omitted")
+    parser.add_argument('--baseline', help="compare against results saved with --save instead of the recorded ones")
+    parser.add_argument('--save', help="write the replayed results to this file, RESULT records like results.bin")
+    parser.add_argument('--json', help="write the report to this file")
+    args = parser.parse_args(argv)
+
+    recording = Recording(args.recording)
+    results, metrics, seconds = replay(recording, args.speed)
+    expected = load_records(args.baseline, RESULT) if args.baseline else recording.results
+    if args.save:
+        results.tofile(args.save)
+
+    channels = recording.channels
+    audio_seconds = recording.frames / recording.sample_freq
+    report = {
+        'recording': args.recording,
+        'audio_seconds': round(audio_seconds, 3),
+        'hops_expected': len(expected) // channels,
+        'hops_replayed': len(results) // channels,
+        **compare(expected, results, recording.sample_freq),
+        'expected_latency_ms': latency_ms(expected),
+        'replayed_latency_ms': latency_ms(results),
+        'replay_seconds': round(seconds, 3),
+        'realtime_factor': round(audio_seconds / seconds, 1) if seconds else None,
+        'metrics': metrics,
+    }
+    for key, value in report.items():
+        if key != 'metrics':
+            print(f"{key}: {value}")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+    if report['rows_differ'] or report['rows_missing']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
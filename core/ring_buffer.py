@@ -0,0 +1,38 @@
+# core/ring_buffer.py
+
+import numpy as np
+
+
+class RingBuffer:
+    # fixed size circular buffer for the analysis window, one row per input channel.
+    # every sample is stored twice (at pos and pos + size) so the latest window
+    # is always one contiguous slice of the storage - no copy needed for the FFT.
+    def __init__(self, size, channels=1, dtype=np.float32):
+        self.size = size
+        self.channels = channels
+        self.buffer = np.zeros((channels, 2 * size), dtype=dtype)
+        self.pos = 0  # index of the oldest sample = next write position
+
+    def write(self, samples):
+        # samples: (frames,) for a single channel or (frames, channels) as delivered by sounddevice
+        if samples.ndim == 1:
+            samples = samples[:, None]
+        if len(samples) > self.size:
+            samples = samples[-self.size:]  # only the newest samples fit in the window
+        first = min(len(samples), self.size - self.pos)
+        self._store(self.pos, samples[:first])
+        self._store(0, samples[first:])
+        self.pos = (self.pos + len(samples)) % self.size
+
+    def _store(self, start, samples):
+        end = start + len(samples)
+        self.buffer[:, start:end] = samples.T
+        self.buffer[:, start + self.size:end + self.size] = samples.T
+
+    def window(self):
+        # (channels, size) view over the last `size` samples, oldest first
+        return self.buffer[:, self.pos:self.pos + self.size]
+
+    def clear(self):
+        self.buffer.fill(0)
+        self.pos = 0
@@ -0,0 +1,260 @@
+# core/server.py
+# headless tuning server for many clients at once - every connection streams float32 PCM and gets its readings
+# pushed back as they are analysed:
+#   python -m core.server --workers 8 --report 10
+#   python -m core.server --connect take.wav --clients 30
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+
+from core import SAMPLE_FREQ, WINDOW_T_LEN, WINDOW_STEP, NUM_HPS, POWER_THRESH, WHITE_NOISE_THRESH, PITCH_DETECTOR, \
+    CONCERT_PITCH, TEMPERAMENT, MIN_FREQ, MAX_FREQ, SERVER_HOST, SERVER_PORT, SERVER_MAX_CHUNK_SECONDS, SERVER_MAX_HELLO
+from core.chromatuna_engine import TunerEngine
+from core.metrics import SessionLatency
+from core.note_table import NoteTable
+
+# frames in both directions: type, payload length, payload
+HEADER = struct.Struct('!cI')
+HELLO = b'H'  # client -> server, json session config: sample_freq, channels, detector, reference, temperament, ...
+READY = b'R'  # server -> client, json: session id, analysis window and hop in frames
+AUDIO = b'A'  # client -> server, little endian float32 frames, channels interleaved
+READINGS = b'P'  # server -> client, packed READING records of the hops the last chunk completed
+STATS = b'S'  # client -> server empty, server -> client json latency snapshot
+ERROR = b'E'  # server -> client, utf-8 message, the connection is closed afterwards
+# one reading: frames analysed so far, channel, note name, tracked frequency in Hz, cents from the note, confidence
+READING = struct.Struct('!IB4sfff')
+
+# state of a worker process. a session stays on one worker, so its engine never has to be sent between processes,
+# and all sessions of a worker fork the same spectral chains and share the note tables
+SESSIONS = {}
+CHAINS = {}
+NOTE_TABLES = {}
+
+
+class Session:
+    def __init__(self, engine):
+        self.engine = engine
+        self.frames = 0
+
+
+def prepare_worker():
+    # builds the stages of the default window once, before the first client waits for them
+    TunerEngine(SAMPLE_FREQ, int(WINDOW_T_LEN * SAMPLE_FREQ), WINDOW_STEP, NUM_HPS, POWER_THRESH, WHITE_NOISE_THRESH,
+                None, shared_chains=CHAINS)
+
+
+def open_session(session, config):
+    sample_freq = int(config.get('sample_freq', SAMPLE_FREQ))
+    channels = int(config.get('channels', 1))
+    window_size = int(round(config.get('window', WINDOW_T_LEN) * sample_freq))
+    window_step = int(round(config.get('step', WINDOW_STEP / SAMPLE_FREQ) * sample_freq))
+    engine = TunerEngine(sample_freq, window_size, window_step, NUM_HPS, POWER_THRESH, WHITE_NOISE_THRESH, None,
+                         channels, shared_chains=CHAINS)
+    engine.verbose = False
+    engine.set_detector(config.get('detector', PITCH_DETECTOR))
+    engine.set_frequency_range(config.get('min_freq', MIN_FREQ), config.get('max_freq', MAX_FREQ))
+    engine.set_target(config.get('target'))
+    key = (float(config.get('reference', CONCERT_PITCH)), config.get('temperament', TEMPERAMENT))
+    if key not in NOTE_TABLES:
+        NOTE_TABLES[key] = NoteTable(*key)
+    engine.note_table = NOTE_TABLES[key]
+    SESSIONS[session] = Session(engine)
+    return {'session': session, 'window': engine.analysis_size, 'hop': engine.hop_size, 'channels': channels}
+
+
+def process_chunk(session, payload):
+    # feeds the chunk hop by hop, so every hop it completes is analysed, and packs the readings of those hops
+    state = SESSIONS[session]
+    engine = state.engine
+    samples = np.frombuffer(payload, dtype='<f4').reshape(-1, engine.channels)
+    readings = bytearray()
+    start = 0
+    while start < len(samples):
+        end = start + engine.hop_size - engine.pending_frames
+        engine.process_hop(samples[start:end])
+        state.frames += len(samples[start:end])
+        start = end
+        if engine.pending_frames:
+            continue
+        for channel, result in enumerate(engine.channel_results):
+            if result is not None:
+                readings += READING.pack(state.frames, channel, result[0].encode(),
+                                         engine.tracked_freqs[channel], engine.detected_cents[channel],
+                                         engine.tracker.confidence[channel])
+    return bytes(readings)
+
+
+def close_session(session):
+    SESSIONS.pop(session, None)
+
+
+async def read_frame(reader, max_length=None):
+    # the length comes from the peer - a frame over max_length is refused before its payload is buffered
+    frame_type, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    if max_length is not None and length > max_length:
+        raise ValueError(f"frame of {length} bytes exceeds the limit of {max_length} bytes")
+    return frame_type, await reader.readexactly(length)
+
+
+def write_frame(writer, frame_type, payload=b''):
+    writer.write(HEADER.pack(frame_type, len(payload)) + payload)
+
+
+class TuningServer:
+    # one engine per connection, run by a pool of single process workers. a worker runs the hops of its sessions in
+    # order, the sessions are spread over the workers by load, so the DSP of many clients scales across the cores
+    # while the event loop only moves bytes.
+    def __init__(self, workers=None):
+        self.pools = [ProcessPoolExecutor(max_workers=1, initializer=prepare_worker)
+                      for _ in range(workers or os.cpu_count())]
+        self.load = [0] * len(self.pools)
+        self.ids = itertools.count(1)
+        self.latencies = {}  # SessionLatency per open session
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        session = next(self.ids)
+        worker = self.load.index(min(self.load))
+        pool = self.pools[worker]
+        self.load[worker] += 1
+        try:
+            frame_type, payload = await read_frame(reader, SERVER_MAX_HELLO)
+            if frame_type != HELLO:
+                raise ValueError("expected a hello frame")
+            config = json.loads(payload or b'{}')
+            info = await loop.run_in_executor(pool, open_session, session, config)
+            latency = self.latencies[session] = SessionLatency(config.get('sample_freq', SAMPLE_FREQ))
+            bytes_per_frame = 4 * info['channels']
+            max_length = int(SERVER_MAX_CHUNK_SECONDS * int(config.get('sample_freq', SAMPLE_FREQ))) * bytes_per_frame
+            write_frame(writer, READY, json.dumps(info).encode())
+            while True:
+                frame_type, payload = await read_frame(reader, max_length)
+                if frame_type == AUDIO:
+                    received = perf_counter()
+                    readings = await loop.run_in_executor(pool, process_chunk, session, payload)
+                    if readings:
+                        write_frame(writer, READINGS, readings)
+                    latency.record(perf_counter() - received, len(payload) // bytes_per_frame)
+                elif frame_type == STATS:
+                    write_frame(writer, STATS, json.dumps(latency.snapshot()).encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # the client hung up
+        except Exception as exc:
+            write_frame(writer, ERROR, str(exc).encode())
+        finally:
+            self.load[worker] -= 1
+            latency = self.latencies.pop(session, None)
+            if latency is not None:
+                print(f"Session {session} closed: {latency.snapshot()}")
+            await loop.run_in_executor(pool, close_session, session)
+            writer.close()
+
+    async def report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            for session, latency in list(self.latencies.items()):
+                print(f"Session {session}: {latency.snapshot()}")
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT, report_interval=None):
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"Tuning server on {host}:{port} with {len(self.pools)} workers")
+        if report_interval:
+            asyncio.get_running_loop().create_task(self.report(report_interval))
+        async with server:
+            await server.serve_forever()
+
+    def shutdown(self):
+        for pool in self.pools:
+            pool.shutdown(cancel_futures=True)
+
+
+async def stream_file(path, host=SERVER_HOST, port=SERVER_PORT, chunk=1024, fast=False, config=None, verbose=True):
+    # test client - streams a file in real time (or as fast as the server answers) and returns the latency snapshot
+    import soundfile as sf
+
+    info = sf.info(path)
+    reader, writer = await asyncio.open_connection(host, port)
+    config = dict(config or {}, sample_freq=info.samplerate, channels=info.channels)
+    write_frame(writer, HELLO, json.dumps(config).encode())
+    frame_type, payload = await read_frame(reader)
+    if frame_type != READY:
+        raise ConnectionError(payload.decode())
+    stats = asyncio.get_running_loop().create_future()
+
+    async def receive():
+        try:
+            while True:
+                frame_type, payload = await read_frame(reader)
+                if frame_type == READINGS and verbose:
+                    for frames, channel, note, freq, cents, confidence in READING.iter_unpack(payload):
+                        note = note.rstrip(bytes(1)).decode()
+                        print(f"{frames / info.samplerate:8.3f}s ch{channel} {note:>4} "
+                              f"{freq:8.2f}Hz {cents:+6.1f}c {confidence:.2f}")
+                elif frame_type == STATS:
+                    stats.set_result(json.loads(payload))
+                elif frame_type == ERROR:
+                    stats.set_exception(ConnectionError(payload.decode()))
+        except asyncio.IncompleteReadError:
+            if not stats.done():
+                stats.set_exception(ConnectionError("server closed the connection"))
+
+    receiver = asyncio.get_running_loop().create_task(receive())
+    for block in sf.blocks(path, blocksize=chunk, dtype='float32', always_2d=True):
+        write_frame(writer, AUDIO, block.astype('<f4').tobytes())
+        await writer.drain()
+        if not fast:
+            await asyncio.sleep(len(block) / info.samplerate)
+    write_frame(writer, STATS)
+    await writer.drain()
+    try:
+        return await stats
+    finally:
+        receiver.cancel()
+        writer.close()
+
+
+async def run_clients(args):
+    config = {'detector': args.detector} if args.detector else {}
+    results = await asyncio.gather(*(stream_file(args.connect, args.host, args.port, args.chunk, args.fast, config,
+                                                 verbose=args.clients == 1) for _ in range(args.clients)))
+    for client, snapshot in enumerate(results):
+        print(f"Client {client}: {snapshot}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m core.server', description="Headless tuning server")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="DSP worker processes")
+    parser.add_argument('--report', type=float, help="print the latency of every session each REPORT seconds")
+    parser.add_argument('--connect', help="run as a test client that streams this audio file")
+    parser.add_argument('--clients', type=int, default=1, help="concurrent test clients streaming the file")
+    parser.add_argument('--chunk', type=int, default=1024, help="frames per audio chunk sent by a test client")
+    parser.add_argument('--fast', action='store_true', help="test clients send as fast as the server answers")
+    parser.add_argument('--detector', help="pitch detector of the test clients' sessions")
+    args = parser.parse_args(argv)
+
+    if args.connect:
+        asyncio.run(run_clients(args))
+        return
+    server = TuningServer(args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.report))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
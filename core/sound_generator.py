@@ -1,64 +1,124 @@
 # core/sound_generator.py
 
+import os
+import threading
+from collections import OrderedDict
+
 import numpy as np
 
+from core import TONE_CACHE_BYTES
+
+# harmonic amplitudes above the fundamental and the ADSR envelope (seconds, sustain level) of each instrument
+INSTRUMENT_PROFILES = {
+    'violin': {'harmonic_amps': [0.6, 0.4, 0.3, 0.2, 0.1, 0.1, 0.1, 0.05, 0.05],
+               'attack': 1, 'decay': 0.2, 'sustain': 0.8, 'release': 1},
+    'guitar': {'harmonic_amps': [0.8, 0.4, 0.2, 0.1, 0.05],
+               'attack': 0.1, 'decay': 0.3, 'sustain': 0.5, 'release': 0.4},
+    'ukulele': {'harmonic_amps': [0.7, 0.3, 0.1, 0.05],
+                'attack': 0.05, 'decay': 0.15, 'sustain': 0.6, 'release': 0.2},
+}
+DEFAULT_PROFILE = {'harmonic_amps': [0.6, 0.4, 0.3, 0.2, 0.1],
+                   'attack': 0.02, 'decay': 1.2, 'sustain': 0.6, 'release': 0.7}
+FUNDAMENTAL_AMP = 0.8
+
+
+class ToneCache:
+    # least recently used rendered tones, evicted once they hold more than max_bytes.
+    # shared by every SoundGenerator, so reopening a tuning window still plays from memory.
+    def __init__(self, max_bytes=TONE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.tones = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()  # tones are rendered ahead of time on a background thread
+
+    def get(self, key):
+        with self.lock:
+            tone = self.tones.get(key)
+            if tone is not None:
+                self.tones.move_to_end(key)
+            return tone
+
+    def put(self, key, tone):
+        if tone.nbytes > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.tones:
+                return
+            self.tones[key] = tone
+            self.nbytes += tone.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.tones.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.tones.clear()
+            self.nbytes = 0
+
+
+TONE_CACHE = ToneCache()
+
 
 class SoundGenerator:
-    def generate_sound(self, instrument='guitar', frequency=55, duration=2.5, sample_rate=44100):
-        t = np.linspace(0, duration, int(duration * sample_rate), False)
-        num_samples = len(t)
-
-        # define the amplitudes for the fundamental and harmonics
-        fundamental_amp = 0.8
-
-        if instrument == 'violin':
-            harmonic_amps = [0.6, 0.4, 0.3, 0.2, 0.1, 0.1, 0.1, 0.05, 0.05]
-            attack_duration = 1  # attack -  1 sec
-            decay_duration = 0.2  # decay(falling) - 200 ms
-            sustain_level = 0.8
-            release_duration = 1  # release - 100ms
-        elif instrument == 'guitar':
-            harmonic_amps = [0.8, 0.4, 0.2, 0.1, 0.05]
-            attack_duration = 0.1
-            decay_duration = 0.3
-            sustain_level = 0.5
-            release_duration = 0.4
-        elif instrument == 'ukulele':
-            harmonic_amps = [0.7, 0.3, 0.1, 0.05]
-            attack_duration = 0.05
-            decay_duration = 0.15
-            sustain_level = 0.6
-            release_duration = 0.2
-        else:
-            harmonic_amps = [0.6, 0.4, 0.3, 0.2, 0.1]
-            attack_duration = 0.02  # 20 ms
-            decay_duration = 1.2  # decay(falling) - 1200 ms
-            sustain_level = 0.6
-            release_duration = 0.7  # release - 700ms
-
-
-        # generate the fundamental sine wave
-        fundamental = fundamental_amp * np.sin(2 * np.pi * frequency * t)
-
-        # generate the harmonics
-        harmonics = np.zeros_like(fundamental)
-        for i, amp in enumerate(harmonic_amps, start=2):
-            harmonic_freq = frequency * i
-            harmonics += amp * np.sin(2 * np.pi * harmonic_freq * t)
-
-        # combine the fundamental and harmonics
-        sound_tone = fundamental + harmonics
-
-        # apply a container to shape the tone
-        attack_env = np.linspace(0, 1, int(attack_duration * sample_rate))
-        decay_env = np.linspace(1, sustain_level, int(decay_duration * sample_rate))
-        sustain_env = np.full(num_samples - len(attack_env) - len(decay_env) - int(release_duration * sample_rate),
-                              sustain_level)
-        release_env = np.linspace(sustain_level, 0, int(release_duration * sample_rate))
-
-        envelope = np.concatenate((attack_env, decay_env, sustain_env, release_env))
-
-        # ensure the envelope length matches the sound tone length
-        envelope = np.resize(envelope, num_samples)
-        sound_tone *= envelope
+    def __init__(self, cache=TONE_CACHE):
+        self.cache = cache
+
+    def generate_sound(self, instrument='guitar', frequency=55, duration=2.5, sample_rate=44100, inharmonicity=0.0):
+        # cached tone - the returned array is shared and read only, copy it before changing it
+        key = (instrument, frequency, duration, sample_rate, inharmonicity)
+        sound_tone = self.cache.get(key)
+        if sound_tone is None:
+            sound_tone = self.render(instrument, frequency, duration, sample_rate, inharmonicity)
+            sound_tone.flags.writeable = False
+            self.cache.put(key, sound_tone)
+        return sound_tone
+
+    def render(self, instrument='guitar', frequency=55, duration=2.5, sample_rate=44100, inharmonicity=0.0):
+        # uncached float32 synthesis, e.g. for one-off detuned test tones
+        profile = INSTRUMENT_PROFILES.get(instrument, DEFAULT_PROFILE)
+        num_samples = int(duration * sample_rate)
+
+        # fundamental and harmonics in one outer product - a stiff string pushes the upper partials sharp
+        # by sqrt(1 + B * n^2). the phase is reduced to whole cycles in float64 before the float32 sine, so
+        # long tones keep their pitch.
+        numbers = np.arange(1, len(profile['harmonic_amps']) + 2)
+        partial_freqs = frequency * numbers * np.sqrt(1 + inharmonicity * numbers ** 2)
+        partial_freqs[0] = frequency
+        amps = np.array([FUNDAMENTAL_AMP] + profile['harmonic_amps'], dtype=np.float32)
+        cycles = np.outer(partial_freqs / sample_rate, np.arange(num_samples))
+        cycles -= np.rint(cycles)
+        phases = cycles.astype(np.float32)
+        phases *= np.float32(2 * np.pi)
+        np.sin(phases, out=phases)
+        sound_tone = amps @ phases
+
+        # apply a container to shape the tone - attack, decay, sustain and release as one piecewise linear
+        # curve, the release never starts before the decay ends
+        attack, decay, release = profile['attack'], profile['decay'], profile['release']
+        sustain_level = profile['sustain']
+        release_start = max(attack + decay, duration - release)
+        t = np.arange(num_samples) / sample_rate
+        envelope = np.interp(t, [0, attack, attack + decay, release_start, release_start + release],
+                             [0, 1, sustain_level, sustain_level, 0])
+        sound_tone *= envelope.astype(np.float32)
         return sound_tone
+
+    def prerender(self, instrument, frequencies, duration=2.5, sample_rate=44100):
+        # fills the cache for every string of a tuning off the Tk thread
+        thread = threading.Thread(target=lambda: [self.generate_sound(instrument, frequency, duration, sample_rate)
+                                                  for frequency in frequencies], daemon=True)
+        thread.start()
+        return thread
+
+
+def export_wav(path, sound_tone, sample_rate):
+    # writes a tone on a background thread, playback never waits for the disk
+    import soundfile as sf
+
+    def write():
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        sf.write(path, sound_tone, sample_rate)
+
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,46 @@
+# core/spectrogram.py
+
+import numpy as np
+
+from core import WATERFALL_FRAMES, WATERFALL_BINS, WATERFALL_MIN_FREQ, WATERFALL_MAX_FREQ, WATERFALL_DB_RANGE
+from core.ring_buffer import RingBuffer
+
+
+class Spectrogram:
+    # history of the chart spectrum for the waterfall, fed by the analysis worker once per analysed hop so a column
+    # is always one hop. every spectrum is resampled onto log spaced frequencies with indices and weights computed
+    # once, and written as one column of a mirrored RingBuffer - one row per frequency, so the newest `frames`
+    # columns are always a contiguous view the chart can draw without a copy.
+    def __init__(self, fft_freqs, frames=WATERFALL_FRAMES, bins=WATERFALL_BINS):
+        self.log_min = np.log2(WATERFALL_MIN_FREQ)
+        self.log_max = np.log2(min(WATERFALL_MAX_FREQ, fft_freqs[-1]))
+        self.frames = frames
+        freqs = 2 ** np.linspace(self.log_min, self.log_max, bins)
+        position = np.interp(freqs, fft_freqs, np.arange(len(fft_freqs)))
+        self.lower = np.minimum(position.astype(np.intp), len(fft_freqs) - 2)
+        self.upper = self.lower + 1
+        self.weight = (position - self.lower).astype(np.float32)
+        # a full scale sine peaks at window_size / 4 in the magnitude of a hann windowed FFT
+        self.full_scale = np.float32((len(fft_freqs) - 1) / 2)
+        self.frame = np.zeros((1, bins), dtype=np.float32)
+        self.upper_values = np.zeros(bins, dtype=np.float32)
+        self.ring = RingBuffer(frames, bins)
+        self.ring.buffer.fill(-WATERFALL_DB_RANGE)
+
+    def push(self, fft_data):
+        # linear interpolation between the two nearest FFT bins, then dB below full scale
+        frame = self.frame[0]
+        np.take(fft_data, self.lower, out=frame, mode='clip')
+        np.take(fft_data, self.upper, out=self.upper_values, mode='clip')
+        self.upper_values -= frame
+        self.upper_values *= self.weight
+        frame += self.upper_values
+        frame /= self.full_scale
+        np.maximum(frame, np.float32(1e-9), out=frame)
+        np.log10(frame, out=frame)
+        frame *= 20
+        self.ring.write(self.frame)
+
+    def window(self):
+        # (bins, frames) view, oldest hop first
+        return self.ring.window()
@@ -0,0 +1,53 @@
+# core/spectrum.py
+
+import numpy as np
+
+# numpy 2 writes real FFTs straight into an out buffer. older releases (the pinned numpy 1.26) go through
+# scipy.fft, which has no out parameter - its single precision result is still a new array on every hop.
+INPLACE_FFT = np.lib.NumpyVersion(np.__version__) >= '2.0.0'
+
+
+class SpectralFrontEnd:
+    # computes one real FFT per hop and shares it between the pitch detector and the charts.
+    # the hann window, frequency axis and output buffers are built once for window_size/sample_freq,
+    # all channels are windowed and transformed together as one 2D array.
+    # the samples are windowed and detected in float32 like the stream delivers them, only the transform runs in
+    # double - numpy's float32 rfft upcasts internally and allocates 16 bytes per sample, the float64 one writes
+    # into the out buffer, so a steady hop allocates nothing on numpy 2.
+    def __init__(self, window_size, sample_freq, channels=1):
+        self.window_size = window_size
+        self.sample_freq = sample_freq
+        self.channels = channels
+        self.delta_freq = sample_freq / window_size
+        self.hann_window = np.hanning(window_size).astype(np.float32)
+        self.freqs = np.fft.rfftfreq(window_size, 1 / sample_freq)
+        self.windowed = np.zeros((channels, window_size), dtype=np.float32)
+        self.fft_input = np.zeros((channels, window_size))
+        self.spectrum = np.zeros((channels, window_size // 2 + 1), dtype=np.complex128)
+        self.magnitude = np.zeros((channels, window_size // 2 + 1))
+        # float32 work copy for the detector - noise gating must not touch the chart data
+        self.detection_spec = np.zeros((channels, window_size // 2), dtype=np.float32)
+        self.rfft = np.fft.rfft if INPLACE_FFT else None  # scipy.fft is only imported by the first transform
+
+    def process(self, samples):
+        # samples: (channels, window_size)
+        self.apply_window(samples)
+        return self.transform()
+
+    def apply_window(self, samples):
+        np.multiply(samples, self.hann_window, out=self.windowed)
+
+    def transform(self):
+        if INPLACE_FFT:
+            np.copyto(self.fft_input, self.windowed)
+            self.rfft(self.fft_input, axis=-1, out=self.spectrum)
+        else:
+            if self.rfft is None:
+                # importing scipy.fft takes a few hundred ms - not while the app starts
+                from scipy import fft
+                self.rfft = fft.rfft
+            # scipy keeps the float32 input in single precision, the result is a new array
+            np.copyto(self.spectrum, self.rfft(self.windowed, axis=-1))
+        np.abs(self.spectrum, out=self.magnitude)
+        np.copyto(self.detection_spec, self.magnitude[:, :self.detection_spec.shape[-1]])
+        return self.detection_spec
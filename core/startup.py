@@ -0,0 +1,22 @@
+# core/startup.py
+
+from time import perf_counter
+
+
+class StartupTimer:
+    # wall clock marks from the first line of main.py to the first idle main loop, reported as one table
+    def __init__(self):
+        self.start = perf_counter()
+        self.marks = []
+
+    def mark(self, label):
+        self.marks.append((label, perf_counter()))
+
+    def report(self):
+        lines = ["Startup:"]
+        previous = self.start
+        for label, moment in self.marks:
+            lines.append(f"  {label:<20} {(moment - previous) * 1000:8.1f} ms")
+            previous = moment
+        lines.append(f"  {'total':<20} {(previous - self.start) * 1000:8.1f} ms")
+        return "\n".join(lines)
@@ -1,12 +1,11 @@
 # gui/string_tuner_window.py
-import threading
 
 import customtkinter as ctk
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import sounddevice as sd
-import soundfile as sf
+import numpy as np
 
-from core.sound_generator import SoundGenerator
+from core import EXPORT_TONES
+from core.drone import RELEASE
+from core.sound_generator import SoundGenerator, export_wav
 
 
 class StringTunerWindow(ctk.CTkToplevel):
@@ -23,6 +22,8 @@ class StringTunerWindow(ctk.CTkToplevel):
         self.target_freq = target_freq
         self.tuner_engine = tuner_engine
         self.chromatic_tuner = chromatic_tuner
+        # render every string of the tuning in the background, so "Play Sound" starts from the cache
+        self.sound_generator.prerender(instrument, app.tunings[instrument][tuning][0]['tuning'].values())
 
         self.current_string_label = ctk.CTkLabel(
             self,
@@ -36,6 +37,9 @@ class StringTunerWindow(ctk.CTkToplevel):
             font=("Verdana", 14))
         self.target_freq_label.pack(padx=10, pady=10)
 
+        self.deviation_label = ctk.CTkLabel(self, text="Deviation: -", font=("Verdana", 14))
+        self.deviation_label.pack(padx=10, pady=10)
+
         self.play_pitch = ctk.CTkButton(
             self,
             text="Play Sound",
@@ -52,6 +56,20 @@ class StringTunerWindow(ctk.CTkToplevel):
 
         # Add other GUI elements here (e.g., signal and FFT visualizations)
         self.play_pitch.pack(padx=10, pady=10)
+        self.drone_button = ctk.CTkButton(
+            self,
+            text="Drone",
+            command=self.toggle_drone,
+            width=150,
+            height=40,
+            fg_color="transparent",
+            hover_color="#FFA500",
+            border_width=1,
+            corner_radius=50,
+            border_color="#FFA500",
+            font=("Cascadia Mono", 14),
+        )
+        self.drone_button.pack(padx=10, pady=10)
         self.next_button = ctk.CTkButton(
             self,
             text="Next String",
@@ -94,9 +112,22 @@ class StringTunerWindow(ctk.CTkToplevel):
             self.current_string_label.configure(text=f"Current String: {next_string}")
             self.target_freq_label.configure(text=f"Target Frequency: {next_target_freq} Hz")
             self.target_freq = next_target_freq
+            # the engine retargets its filters and answers on the next hop
+            self.tuner_engine.set_target(next_target_freq)
+            if self.tuner_engine.drone:
+                # a held drone glides to the next string
+                self.tuner_engine.drone.set_frequency(next_target_freq)
         else:
+            if self.tuner_engine.drone:
+                self.tuner_engine.drone.stop()
             self.destroy()
 
+    def show_deviation(self, cents):
+        if np.isnan(cents):
+            self.deviation_label.configure(text="Deviation: -")
+        else:
+            self.deviation_label.configure(text=f"Deviation: {cents:+.1f} cents")
+
     def update_gui(self, note, freq, pitch, diff=0):
         current_freq = round(freq, 1)
         diff = round(diff, 1)
@@ -117,13 +148,25 @@ class StringTunerWindow(ctk.CTkToplevel):
         self.chromatic_tuner.update_gui(note, freq, pitch, diff)
 
     def play_sound(self):
+        import sounddevice as sd  # PortAudio is loaded with the first played tone
+
         guitar_sound = self.sound_generator.generate_sound(self.instrument, self.target_freq)
-        sd.play(guitar_sound, blocking=False)
-        # Save the generated guitar tone to a WAV file
-        wav_file_path = 'assets/' + self.instrument + '/' + self.string_order[self.current_string_index] + '_' + str(self.target_freq) + '.wav'
-        sf.write(wav_file_path, guitar_sound, 44100)
+        sd.play(guitar_sound, 44100, blocking=False)
+        if EXPORT_TONES:
+            # Save the generated guitar tone to a WAV file without holding up the window
+            wav_file_path = 'assets/' + self.instrument + '/' + self.string_order[self.current_string_index] + '_' + \
+                str(self.target_freq) + '.wav'
+            export_wav(wav_file_path, guitar_sound, 44100)
+
+    def toggle_drone(self):
+        drone = self.tuner_engine.drone
+        if drone.sounding and drone.state != RELEASE:
+            drone.release()
+            self.drone_button.configure(text="Drone")
+        else:
+            drone.play(self.target_freq)
+            self.drone_button.configure(text="Stop Drone")
 
     def start_tuning(self):
-        if self.tuner_engine.stream_thread is None or not self.tuner_engine.stream_thread.is_alive():
-            self.tuner_engine.stream_thread = threading.Thread(target=self.tuner_engine.start_stream)
-            self.tuner_engine.stream_thread.start()
\ No newline at end of file
+        if self.tuner_engine.source is None:
+            self.tuner_engine.start_stream()
\ No newline at end of file
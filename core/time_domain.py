@@ -0,0 +1,127 @@
+# core/time_domain.py
+
+import numpy as np
+
+from core import MIN_FREQ, MAX_FREQ, ACF_CUTOFF, MPM_CUTOFF, YIN_THRESH
+from core.pitch_detector import PitchDetector, parabolic_offsets
+
+
+class TimeDomainDetector(PitchDetector):
+    # base of the lag domain detectors. the analysis window only has to hold two periods of the lowest
+    # searched fundamental, so a 41Hz E1 needs ~60ms of audio instead of the one second window of the HPS.
+    # all correlations are computed with zero padded FFTs over every channel at once.
+    domain = 'time'
+
+    def __init__(self, sample_freq, min_freq=MIN_FREQ, max_freq=MAX_FREQ, channels=1, max_window=None):
+        self.sample_freq = sample_freq
+        self.max_window = max_window  # audio the engine buffers, the window never asks for more
+        super().__init__(min_freq, max_freq, channels)
+
+    def set_range(self, min_freq, max_freq):
+        super().set_range(min_freq, max_freq)
+        self.min_lag = max(2, int(self.sample_freq / max_freq))
+        self.max_lag = int(np.ceil(self.sample_freq / min_freq)) + 1
+        if self.max_window:
+            # two periods have to fit in the buffered audio - lower fundamentals are out of reach of a short ring
+            self.max_lag = max(self.min_lag + 1, min(self.max_lag, self.max_window // 2))
+        self.window_size = 2 * self.max_lag
+        # twice the window keeps the circular correlation of the FFT free of wrap around
+        self.fft_size = 1 << int(np.ceil(np.log2(2 * self.window_size)))
+        self.lags = np.arange(self.max_lag + 1)
+
+    def detect(self, windows):
+        frames = windows[:, -self.window_size:]
+        frames = frames - frames.mean(axis=-1, keepdims=True)
+        lag_function = self.lag_function(frames)
+        lag = self.pick(lag_function)
+        found = lag > 0
+        lag = np.where(found, lag, self.min_lag)
+        period = lag + parabolic_offsets(lag_function, lag)
+        freqs = self.sample_freq / period
+        freqs[~found] = np.nan
+        return freqs
+
+    def lag_function(self, frames):
+        raise NotImplementedError
+
+    def pick(self, lag_function):
+        # lag of the period per channel, -1 where the frame is not periodic
+        raise NotImplementedError
+
+    def autocorrelation(self, frames):
+        spectrum = np.fft.rfft(frames, self.fft_size, axis=-1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        return np.fft.irfft(power, self.fft_size, axis=-1)[:, :self.max_lag + 1]
+
+    def cumulative_energy(self, frames):
+        # energy of the first k samples at index k
+        energy = np.zeros((len(frames), frames.shape[-1] + 1))
+        np.cumsum(frames ** 2, axis=-1, out=energy[:, 1:])
+        return energy
+
+    def first_peak(self, values, cutoff):
+        # first local maximum in the lag range that reaches cutoff * the highest one - taking the first
+        # instead of the highest peak keeps the detector off multiples of the period (octave errors)
+        inner = values[:, 1:-1]
+        peaks = (inner > values[:, :-2]) & (inner >= values[:, 2:]) & (inner > 0)
+        peaks[:, :self.min_lag - 1] = False
+        highest = np.where(peaks, inner, -np.inf).max(axis=-1, keepdims=True)
+        candidates = peaks & (inner >= cutoff * highest)
+        lag = np.argmax(candidates, axis=-1) + 1
+        return np.where(candidates.any(axis=-1), lag, -1)
+
+
+class AutocorrelationDetector(TimeDomainDetector):
+    # FFT based autocorrelation, normalised by the frame energy and unbiased for the shrinking overlap
+    def lag_function(self, frames):
+        acf = self.autocorrelation(frames)
+        energy = np.maximum(acf[:, :1], np.finfo(np.float64).tiny)
+        return acf / energy * (self.window_size / (self.window_size - self.lags))
+
+    def pick(self, acf):
+        return self.first_peak(acf, ACF_CUTOFF)
+
+
+class McLeodDetector(TimeDomainDetector):
+    # McLeod pitch method - normalised square difference function, picks the first key maximum
+    def lag_function(self, frames):
+        acf = self.autocorrelation(frames)
+        energy = self.cumulative_energy(frames)
+        # m(tau) = sum over the overlap of x[j]^2 + x[j + tau]^2
+        overlap = energy[:, self.window_size - self.lags] + energy[:, -1:] - energy[:, self.lags]
+        return 2 * acf / np.maximum(overlap, np.finfo(np.float64).tiny)
+
+    def pick(self, nsdf):
+        return self.first_peak(nsdf, MPM_CUTOFF)
+
+
+class YinDetector(TimeDomainDetector):
+    # YIN - cumulative mean normalised difference function, the difference function is built from
+    # one FFT cross correlation and running sums of the signal energy
+    def lag_function(self, frames):
+        integration = self.max_lag
+        head = np.fft.rfft(frames[:, :integration], self.fft_size, axis=-1)
+        full = np.fft.rfft(frames, self.fft_size, axis=-1)
+        cross = np.fft.irfft(np.conj(head) * full, self.fft_size, axis=-1)[:, :self.max_lag + 1]
+        energy = self.cumulative_energy(frames)
+        shifted_energy = energy[:, self.lags + integration] - energy[:, self.lags]
+        difference = shifted_energy[:, :1] + shifted_energy - 2 * cross
+
+        cmnd = np.ones_like(difference)
+        cumulative = np.cumsum(difference[:, 1:], axis=-1)
+        cmnd[:, 1:] = difference[:, 1:] * self.lags[1:] / np.maximum(cumulative, np.finfo(np.float64).tiny)
+        return cmnd
+
+    def pick(self, cmnd):
+        # first dip under the threshold, followed down to its local minimum
+        below = cmnd < YIN_THRESH
+        below[:, :self.min_lag] = False
+        first = np.argmax(below, axis=-1)
+        rising = np.zeros_like(below)
+        rising[:, :-1] = cmnd[:, 1:] >= cmnd[:, :-1]
+        rising &= self.lags >= first[:, None]
+        lag = np.argmax(rising, axis=-1)
+        # no dip under the threshold - fall back to the global minimum if it is still clearly periodic
+        fallback = self.min_lag + np.argmin(cmnd[:, self.min_lag:], axis=-1)
+        periodic = cmnd[np.arange(len(cmnd)), fallback] < 2 * YIN_THRESH
+        return np.where(below.any(axis=-1), lag, np.where(periodic, fallback, -1))
@@ -0,0 +1,101 @@
+# core/tuning_catalog.py
+
+import json
+
+import numpy as np
+
+from core import IDENTIFY_STABLE_HOPS, IDENTIFY_STABLE_CENTS, IDENTIFY_MISS_CENTS
+
+
+def load_tunings(path='assets/tunings.json'):
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+class TuningCatalog:
+    # every tuning of every instrument compiled once into one log2 frequency matrix - a row per tuning and a column
+    # per string, padded with nan for instruments with fewer strings. played pitches are scored against all rows in
+    # one array operation, so hundreds of custom tunings cost no more python than a handful.
+    def __init__(self, tunings, miss_cents=IDENTIFY_MISS_CENTS):
+        self.miss_cents = miss_cents
+        self.keys = []  # (instrument, tuning) of every row
+        self.names = []
+        self.strings = []  # {string: frequency} of every row
+        for instrument, presets in tunings.items():
+            for tuning, preset in presets.items():
+                self.keys.append((instrument, tuning))
+                self.names.append(preset[0]['name'])
+                self.strings.append(preset[0]['tuning'])
+        self.index = {key: row for row, key in enumerate(self.keys)}
+
+        width = max((len(strings) for strings in self.strings), default=0)
+        self.log_freqs = np.full((len(self.keys), width), np.nan)
+        for row, strings in enumerate(self.strings):
+            self.log_freqs[row, :len(strings)] = np.log2(list(strings.values()))
+        self.string_counts = np.maximum(np.count_nonzero(~np.isnan(self.log_freqs), axis=-1), 1)
+
+    def scores(self, freqs):
+        # mean distance in cents between the played pitches and the strings of every tuning, taken both ways:
+        # every pitch to its nearest string and every string to its nearest pitch, so a tuning neither wins with
+        # strings nobody played nor with a subset of the played ones. lower is better.
+        log_played = np.log2(np.asarray(freqs, dtype=float))
+        if not len(log_played):
+            return np.full(len(self.keys), np.inf)
+        # (tunings, strings, pitches), capped so a single stray reading cannot outweigh the rest
+        cents = np.abs(self.log_freqs[:, :, None] - log_played) * 1200
+        np.minimum(cents, self.miss_cents, out=cents)
+        # fmin skips the nan padding, min keeps it and nansum drops it again
+        pitch_to_string = np.fmin.reduce(cents, axis=1).mean(axis=-1)
+        string_to_pitch = np.nansum(cents.min(axis=-1), axis=-1) / self.string_counts
+        return (pitch_to_string + string_to_pitch) / 2
+
+    def identify(self, freqs):
+        # (instrument, tuning, score) of the closest tuning
+        scores = self.scores(freqs)
+        row = int(np.argmin(scores))
+        return (*self.keys[row], float(scores[row]))
+
+    def ranking(self, freqs, count=5):
+        # the `count` closest tunings, best first
+        scores = self.scores(freqs)
+        rows = np.argsort(scores, kind='stable')[:count]
+        return [(*self.keys[row], float(scores[row])) for row in rows]
+
+
+class TuningIdentifier:
+    # collects the strings strummed one by one from the readings of consecutive hops and keeps the closest tuning of
+    # the catalog. a pitch is collected once it held within stable_cents for stable_hops hops, a pitch that close to
+    # a collected one replaces it instead of adding another string.
+    def __init__(self, catalog, stable_hops=IDENTIFY_STABLE_HOPS, stable_cents=IDENTIFY_STABLE_CENTS):
+        self.catalog = catalog
+        self.stable_cents = stable_cents
+        self.recent = np.full(stable_hops, np.nan)  # log2 of the latest readings, a ring
+        self.position = 0
+        self.pitches = []  # log2 of the collected strings
+        self.match = None  # (instrument, tuning, score) of the closest tuning
+
+    def reset(self):
+        self.recent.fill(np.nan)
+        self.position = 0
+        self.pitches = []
+        self.match = None
+
+    def add(self, freq):
+        # one reading per hop, nan when nothing was detected. returns the match when a string was collected
+        self.recent[self.position] = np.log2(freq) if freq > 0 else np.nan
+        self.position = (self.position + 1) % len(self.recent)
+        if np.isnan(self.recent).any() or np.ptp(self.recent) * 1200 > self.stable_cents:
+            return None
+        pitch = float(self.recent.mean())
+        self.recent.fill(np.nan)
+        for index, collected in enumerate(self.pitches):
+            if abs(pitch - collected) * 1200 <= self.stable_cents:
+                self.pitches[index] = pitch
+                break
+        else:
+            self.pitches.append(pitch)
+        self.match = self.catalog.identify(2 ** np.array(self.pitches))
+        return self.match
+
+    def frequencies(self):
+        return sorted(2 ** pitch for pitch in self.pitches)
@@ -0,0 +1,137 @@
+# gui/live_plots.py
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+from core import PLOT_MAX_FREQ, WATERFALL_DB_RANGE, ALL_NOTES
+
+
+def min_max_decimate(samples, width, out):
+    # reduce the waveform to a (min, max) pair per pixel column - out holds 2 * width points
+    step = len(samples) // width
+    columns = samples[:step * width].reshape(width, step)
+    np.min(columns, axis=1, out=out[0::2])
+    np.max(columns, axis=1, out=out[1::2])
+    return out
+
+
+class LivePlot:
+    # chart with a persistent line - new data goes in via set_data and only the line is blitted
+    # over a cached background of the static parts (axes, ticks, labels).
+    def __init__(self, master, title, xlim, ylim, xlabel=None, ylabel=None, log_y=False, pad=5):
+        self.figure, self.ax = plt.subplots(figsize=(4, 3))
+        self.ax.set_title(title)
+        if xlabel:
+            self.ax.set_xlabel(xlabel)
+        if ylabel:
+            self.ax.set_ylabel(ylabel)
+        if log_y:
+            self.ax.set_yscale('log')
+        self.ax.set_xlim(*xlim)
+        self.ax.set_ylim(*ylim)
+        self.line, = self.ax.plot([], [], animated=True)
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master)
+        self.canvas.get_tk_widget().pack(padx=pad, pady=pad)
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.canvas.draw()
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
+    def pixel_width(self):
+        return max(1, int(self.ax.bbox.width))
+
+    def update(self, x, y):
+        if x is None:
+            self.line.set_ydata(y)
+        else:
+            self.line.set_data(x, y)
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
+
+    def expand_ylim(self, top):
+        # rare full redraw when the data outgrows the fixed limits - refreshes the cached background
+        bottom, current_top = self.ax.get_ylim()
+        if top > current_top:
+            self.ax.set_ylim(bottom, top * 2)
+            self.canvas.draw()
+
+
+class Waterfall:
+    # scrolling spectrogram of the last hops. the engine's Spectrogram gets a column per analysed hop on the
+    # worker thread, the chart only draws its contiguous view: a single animated imshow that gets the view through
+    # set_data and is blitted over the cached axes, nothing else is redrawn.
+    def __init__(self, master, spectrogram, hop_seconds, pad=5):
+        self.spectrogram = spectrogram
+        log_min, log_max = spectrogram.log_min, spectrogram.log_max
+        self.figure, self.ax = plt.subplots(figsize=(4, 3))
+        self.ax.set_title("Spectrogram")
+        self.ax.set_xlabel("Seconds")
+        self.image = self.ax.imshow(spectrogram.window(), origin='lower', aspect='auto', cmap='magma', animated=True,
+                                    extent=(-spectrogram.frames * hop_seconds, 0, log_min, log_max),
+                                    vmin=-WATERFALL_DB_RANGE, vmax=0, interpolation='nearest')
+        # the rows are spaced in octaves - label the a of every octave in range
+        octaves = np.arange(np.ceil(log_min - np.log2(27.5)), np.floor(log_max - np.log2(27.5)) + 1)
+        self.ax.set_yticks(np.log2(27.5) + octaves)
+        self.ax.set_yticklabels([f"{ALL_NOTES[0]}{int(octave)} {27.5 * 2 ** octave:g}" for octave in octaves])
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master)
+        self.canvas.get_tk_widget().pack(padx=pad, pady=pad)
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.canvas.draw()
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.image)
+
+    def update(self):
+        self.image.set_data(self.spectrogram.window())
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.ax.draw_artist(self.image)
+        self.canvas.blit(self.ax.bbox)
+
+
+class LivePlots:
+    # amplitude and fft charts of the tuner window, and the waterfall of a spectrogram fed by the engine
+    def __init__(self, master, window_size, fft_freqs, spectrogram=None, hop_seconds=None):
+        self.signal_plot = LivePlot(master, "Amplitude", (0, window_size), (-1, 1))
+        self.fft_plot = LivePlot(master, "FFT", (0, PLOT_MAX_FREQ), (1e-3, 1e3), "Frequency (Hz)", "Amplitude",
+                                 log_y=True, pad=50)
+
+        # waveform decimated to one min/max pair per pixel column
+        self.width = min(self.signal_plot.pixel_width(), window_size)
+        step = window_size // self.width
+        self.signal_x = np.repeat(np.arange(self.width) * step, 2)
+        self.signal_y = np.zeros(2 * self.width, dtype=np.float32)
+        self.signal_plot.line.set_data(self.signal_x, self.signal_y)
+
+        # crop the FFT data to the max frequency once - the frequency axis never changes
+        self.fft_end = int(np.searchsorted(fft_freqs, PLOT_MAX_FREQ, side='right'))
+        self.fft_plot.line.set_data(fft_freqs[:self.fft_end], np.zeros(self.fft_end))
+        self.waterfall = None
+        if spectrogram is not None and hop_seconds:
+            self.waterfall = Waterfall(master, spectrogram, hop_seconds)
+
+    def render(self, window_samples, fft_data, new_spectrum=True):
+        min_max_decimate(window_samples, self.width, self.signal_y)
+        self.signal_plot.update(None, self.signal_y)
+        if not new_spectrum:
+            return
+
+        if self.waterfall:
+            self.waterfall.update()
+        fft_data = fft_data[:self.fft_end]
+        self.fft_plot.expand_ylim(fft_data.max())
+        self.fft_plot.update(None, fft_data)
@@ -1,22 +1,21 @@
 # gui/tuner_app.py
 
-import json
 import tkinter as tk
 from tkinter import END
 import customtkinter as ctk
-import sounddevice as sd
-import soundfile as sf
 
 from core.sound_generator import SoundGenerator
 from core.chromatuna_engine import TunerEngine
 from gui.tuner_window import TunerWindow
 from core.chroma_tuna import ChromaTuna
-from core import SAMPLE_FREQ, WINDOW_SIZE, WINDOW_STEP, NUM_HPS, POWER_THRESH, WHITE_NOISE_THRESH
+from core.tuning_catalog import TuningCatalog, load_tunings
+from core import SAMPLE_FREQ, WINDOW_SIZE, WINDOW_STEP, NUM_HPS, POWER_THRESH, WHITE_NOISE_THRESH, CHANNELS
 
 
 class TunerApp:
     def __init__(self, master):
         self.tunings = None
+        self.catalog = None
         self.tuning = None
         self.instrument = None
         self.master = master
@@ -27,7 +26,8 @@ class TunerApp:
             NUM_HPS,
             POWER_THRESH,
             WHITE_NOISE_THRESH,
-            self
+            self,
+            CHANNELS
         )
         self.chromatic_tuner = ChromaTuna(self.tuner_engine)
         self.sound_generator = SoundGenerator()
@@ -36,14 +36,14 @@ class TunerApp:
 
     def default_configuration(self):
         # get instrument & its tunings from json file
-        with open("assets/tunings.json", "r") as file:
-            self.tunings = json.load(file)
+        self.tunings = load_tunings()
+        self.catalog = TuningCatalog(self.tunings)  # compiled once for tuning identification
         self.instrument = 'guitar'
         self.tuning = 'standard'
 
     def setup_gui(self):
         self.master.title("Chromatuna")
-        self.master.geometry("550x500")
+        self.master.geometry("550x560")
         self.master.resizable(False, False)
         self.master.iconbitmap("assets/chromatuna.ico")
         # self.master.wm_attributes('-toolwindow', 'True')
@@ -102,10 +102,25 @@ class TunerApp:
             font=("Cascadia Mono", 14),
         )
 
+        identify_button = ctk.CTkButton(
+            self.master,
+            text="Identify Tuning",
+            command=self.chromatic_tuner.identify_tuning,
+            width=150,
+            height=40,
+            fg_color="transparent",
+            hover_color="#66B",
+            border_width=1,
+            corner_radius=50,
+            border_color="#66B",
+            font=("Cascadia Mono", 14),
+        )
+
         instrument_list.pack(expand=True, padx=5, pady=5)
         tuning_button.pack(padx=10, pady=10)
         start_tuning.pack(padx=10, pady=10)
         chromatic_button.pack(padx=10, pady=10)
+        identify_button.pack(padx=10, pady=10)
 
     def select_tuning(self):
         print("Selecting tuning...")
@@ -1,9 +1,28 @@
 # main.py
 
-from gui.tuner_app import TunerApp
-import customtkinter as ctk
+import sys
+
+from core import STARTUP_REPORT
+from core.startup import StartupTimer
+
+# heavy modules (matplotlib, sounddevice, soundfile) are imported by the features that use them
+timer = StartupTimer()
+import customtkinter as ctk  # noqa: E402
+timer.mark("customtkinter")
+from gui.tuner_app import TunerApp  # noqa: E402
+timer.mark("app modules")
+
+
+def print_startup_report():
+    timer.mark("first idle")
+    print(timer.report())
+
 
 if __name__ == "__main__":
     root = ctk.CTk()
+    timer.mark("root window")
     app = TunerApp(root)
+    timer.mark("tuner app")
+    if STARTUP_REPORT or '--startup-report' in sys.argv:
+        root.after_idle(print_startup_report)
     root.mainloop()